@@ -0,0 +1,143 @@
+#
+#    batch_solve.py
+#
+#   Solves many random scrambles on every core and records the solution lengths, without opening a window
+#
+#   Usage: python batch_solve.py --count 100000 --output solutions.jsonl (or .csv, default is JSONL on stdout)
+#
+#   Workers open the solver tables memory-mapped (see tables.py), so every process shares the same pages
+#
+
+
+# --- IMPORTS -------------------------------------------------------------------------------------------------
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from cube import ALL_MOVES, apply_moves_batch, cube_geometry, generate_scramble_batch
+import solver
+
+
+# --- CONSTANTS ------------------------------------------------------------------------------------------------
+DEFAULT_SCRAMBLE_LENGTH = 25
+DEFAULT_CHUNK_SIZE = 64 # States sent to a worker at a time
+PROGRESS_SECS = 5 # How often throughput is reported while solving
+
+FIELDS = ["index", "scramble", "solution", "length", "quarter_turns", "seconds"]
+
+
+# --- WORKERS -------------------------------------------------------------------------------------------------
+def init_worker(max_length):
+	# Runs once per worker process: maps the tables (already built by the parent) and keeps the solver around
+	global worker_solver, worker_max_length
+	worker_solver = solver.Solver(solver.load_tables(verify=False))
+	worker_max_length = max_length
+
+
+def solve_chunk(chunk):
+	# chunk is a list of (index, scramble moves, cube state), returns one result dict per state
+	results = []
+	for index, scramble, state in chunk:
+		start = time.perf_counter()
+		moves = worker_solver.solve(state, worker_max_length)
+		seconds = time.perf_counter() - start
+
+		results.append({
+			"index": index,
+			"scramble": " ".join(scramble),
+			"solution": None if moves is None else " ".join(moves),
+			"length": None if moves is None else len(moves),
+			"quarter_turns": None if moves is None else len(solver.to_quarter_turns(moves)),
+			"seconds": round(seconds, 6),
+		})
+	return results
+
+
+# --- FUNCTIONS -----------------------------------------------------------------------------------------------
+def generate_chunks(count, length, seed, chunk_size):
+	# Scrambles in the ALL_MOVES vocabulary and their states, split into chunks for the workers
+	scrambles = generate_scramble_batch(count, length, seed)
+	states = apply_moves_batch(np.tile(cube_geometry(3).solved, (count, 1)), scrambles)
+
+	for start in range(0, count, chunk_size):
+		yield [
+			(index, [ALL_MOVES[move] for move in scrambles[index]], states[index])
+			for index in range(start, min(start + chunk_size, count))
+		]
+
+
+class ResultWriter:
+	# Streams results as JSON lines or CSV rows, flushing after every chunk
+
+	def __init__(self, file, format):
+		self.file = file
+		self.csv_writer = None
+		if format == "csv":
+			self.csv_writer = csv.DictWriter(file, fieldnames=FIELDS)
+			self.csv_writer.writeheader()
+
+	def write(self, results):
+		for result in results:
+			if self.csv_writer:
+				self.csv_writer.writerow(result)
+			else:
+				self.file.write(json.dumps(result) + "\n")
+		self.file.flush()
+
+
+def batch_solve(count, length=DEFAULT_SCRAMBLE_LENGTH, seed=None, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+		max_length=solver.DEFAULT_MAX_LENGTH, output=sys.stdout, format="jsonl", log=sys.stderr):
+	# Solves count random scrambles with a process pool, writes every result to output and returns solves per second
+	# Building the tables here first means workers only ever map finished files
+	solver.load_tables()
+
+	writer = ResultWriter(output, format)
+	solved = 0
+	start = last_report = time.perf_counter()
+
+	with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(max_length,)) as executor:
+		for results in executor.map(solve_chunk, generate_chunks(count, length, seed, chunk_size)):
+			writer.write(results)
+			solved += len(results)
+
+			now = time.perf_counter()
+			if now - last_report >= PROGRESS_SECS:
+				print(f"{solved}/{count} solved, {solved / (now - start):.1f} solves/s", file=log)
+				last_report = now
+
+	elapsed = time.perf_counter() - start
+	rate = solved / elapsed if elapsed else 0.0
+	print(f"Solved {solved} states in {elapsed:.1f}s: {rate:.1f} solves/s (workers: {workers or os.cpu_count()})",
+		file=log)
+
+	return rate
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Solve random scrambles in parallel and record solution lengths")
+	parser.add_argument("--count", type=int, default=1000, help="number of scrambles to solve")
+	parser.add_argument("--length", type=int, default=DEFAULT_SCRAMBLE_LENGTH, help="moves per scramble")
+	parser.add_argument("--seed", type=int, default=None, help="random seed for the scrambles")
+	parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+	parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="states per task")
+	parser.add_argument("--max-length", type=int, default=solver.DEFAULT_MAX_LENGTH, help="longest solution accepted")
+	parser.add_argument("--output", default=None, help="output file, .csv for CSV, anything else for JSONL")
+	args = parser.parse_args()
+
+	format = "csv" if args.output and args.output.endswith(".csv") else "jsonl"
+	output = open(args.output, "w", newline="") if args.output else sys.stdout
+	try:
+		batch_solve(args.count, args.length, args.seed, args.workers, args.chunk_size, args.max_length, output, format)
+	finally:
+		if args.output:
+			output.close()
+
+
+if __name__ == "__main__":
+	main()
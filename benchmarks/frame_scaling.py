@@ -0,0 +1,70 @@
+#
+#    benchmarks/frame_scaling.py
+#
+#   Measures how long main.py takes to draw one frame for different cube sizes, without opening a window
+#
+#   Usage: python benchmarks/frame_scaling.py [sizes...] (default: 2 to 7, 10 and 15)
+#
+
+
+# --- IMPORTS -------------------------------------------------------------------------------------------------
+import os
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "hide")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame
+
+import main
+
+
+# --- SETTINGS -------------------------------------------------------------------------------------------------
+DEFAULT_SIZES = [2, 3, 4, 5, 6, 7, 10, 15]
+FRAMES = 120 # Frames drawn per size and case
+TURN_ANGLE = 45 # How far the turning layer is rotated in the "turning" case
+
+
+# --- FUNCTIONS -----------------------------------------------------------------------------------------------
+def time_frames(squares):
+	# Average ms to draw the cube while the view turns a degree every frame
+	surface = main.screen
+	start = time.perf_counter()
+	for frame in range(FRAMES):
+		main.draw_scene(surface, main.displayed_cube, 100, squares, None, (20, (325 + frame) % 360, 0))
+	return (time.perf_counter() - start) / FRAMES * 1000
+
+
+def benchmark(size):
+	main.set_cube_size(size)
+	main.rubiks_cube.scramble(25)
+	main.skip_turn_animations()
+
+	idle = time_frames(main.SQUARES)
+
+	main.turn_queue.append(["R", main.cube_turn_speed])
+	main.turn_angle = TURN_ANGLE
+	turning = time_frames(main.animated_squares())
+	main.skip_turn_animations()
+
+	return idle, turning
+
+
+def run(sizes):
+	pygame.init()
+	main.screen = pygame.display.set_mode((main.SCREEN_WIDTH, main.SCREEN_HEIGHT))
+	main.xaxis_rot, main.yaxis_rot, main.zaxis_rot = 20, 325, 0
+	main.scrambling = False
+
+	print(f"{'size':>6} {'squares':>8} {'idle ms':>9} {'turning ms':>11}")
+	for size in sizes:
+		idle, turning = benchmark(size)
+		print(f"{size:>6} {6*size*size:>8} {idle:>9.2f} {turning:>11.2f}")
+
+	pygame.quit()
+
+
+if __name__ == "__main__":
+	run([int(size) for size in sys.argv[1:]] or DEFAULT_SIZES)
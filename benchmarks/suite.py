@@ -0,0 +1,274 @@
+#
+#    benchmarks/suite.py
+#
+#   Benchmarks of the engine and renderer hot paths, run without opening a window (SDL dummy video driver)
+#
+#   Usage: python benchmarks/suite.py [--output results.json] [--compare old_results.json] [--filter name] [--quick]
+#
+#   Every benchmark uses fixed seeds, so two runs (or two commits) do the same work. Results are printed as a table
+#   and can be saved as JSON, with the commit and library versions, to compare against later with --compare
+#   ops/s and mean us are per operation (e.g. per move for turn), p50 and p95 are per call
+#
+
+
+# --- IMPORTS -------------------------------------------------------------------------------------------------
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "hide")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+import pygame
+
+import cube
+import main
+import solver
+from projection_cache import ProjectionCache
+
+
+# --- SETTINGS -------------------------------------------------------------------------------------------------
+SEED = 1234
+MIN_SECS = 0.5 # Time each benchmark runs for (at least one call)
+QUICK_MIN_SECS = 0.1
+REPEATS = 5 # The median of this many runs is reported
+ATTRACT_CACHE_MB = 32 # Projection cache of project_attract_loop, the only benchmark drawing through a cache
+
+
+# --- HARNESS --------------------------------------------------------------------------------------------------
+attract_cache = ProjectionCache(ATTRACT_CACHE_MB * 2**20)
+
+
+class FrameClock:
+	# Stands in for pygame.time.Clock so draw_all doesn't wait for the next frame
+	def tick(self, framerate=0):
+		return 0
+
+	def get_fps(self):
+		return float(main.FPS)
+
+
+def run_benchmark(function, min_secs, ops_per_call=1):
+	# Calls function until min_secs have passed, REPEATS times, and returns
+	# {"ops_per_sec", "mean_us", "p50_ms", "p95_ms"} with the median ops/s of the runs and the percentiles of all calls
+	call_times = []
+	rates = []
+	for _ in range(REPEATS):
+		calls = 0
+		start = time.perf_counter()
+		while True:
+			call_start = time.perf_counter()
+			function()
+			now = time.perf_counter()
+			call_times.append(now - call_start)
+			calls += 1
+			if now - start >= min_secs / REPEATS:
+				break
+		rates.append(calls * ops_per_call / (now - start))
+
+	call_times = np.array(call_times) * 1000
+	ops_per_sec = float(np.median(rates))
+	return {
+		"ops_per_sec": ops_per_sec,
+		"mean_us": 1e6 / ops_per_sec,
+		"p50_ms": float(np.percentile(call_times, 50)),
+		"p95_ms": float(np.percentile(call_times, 95)),
+	}
+
+
+def setup_main():
+	# The globals main() would set up, with a fixed view
+	pygame.init()
+	main.screen = pygame.display.set_mode((main.SCREEN_WIDTH, main.SCREEN_HEIGHT))
+	main.clock = FrameClock()
+	main.xaxis_rot, main.yaxis_rot, main.zaxis_rot = 20, 325, 0
+	main.started = True
+	main.pre_start_frames = 0
+	main.post_start_frames = 10**6
+	main.scrambling = main.scrambled = main.solved = False
+	main.start_time = main.final_time = None
+	main.projection_cache = None # Every other benchmark draws without the cache, whatever PROJECTION_CACHE_MB is
+	main.set_cube_size(3)
+
+
+def cycle(values):
+	# Function returning the next value every call, wrapping around
+	values = list(values)
+	state = {"index": -1}
+
+	def next_value():
+		state["index"] = (state["index"] + 1) % len(values)
+		return values[state["index"]]
+
+	return next_value
+
+
+# --- BENCHMARKS -----------------------------------------------------------------------------------------------
+def benchmarks():
+	# (name, function, ops per call), each set up with fixed seeds
+	rng = np.random.default_rng(SEED)
+	random.seed(SEED)
+	items = []
+
+	# Projection of every vertex of the cube at once
+	points = main.SQUARES.reshape(-1, 3) * main.SQUARE_SCALE
+	items.append(("get_projection", lambda: main.get_projection(points[:, 0], points[:, 1], points[:, 2]), 1))
+
+	# Rotate, cull, sort and project the cube for a new view angle every call (replaces rotated_point)
+	matrices = cycle(cube.rotation_matrix(*angles) for angles in rng.uniform(0, 360, (64, 3)))
+	squares = main.SQUARES * main.SQUARE_SCALE
+	items.append(("transform_squares", lambda: main.transform_squares(squares, matrices()), 1))
+
+	# The start screen's spin once it has gone round once, looked up in a projection cache of its own
+	attract_views = [(0, -step * 9 / 60 % 360, 0) for step in range(2400)]
+	next_attract_view = cycle(attract_views)
+
+	def project_attract(view):
+		main.projection_cache = attract_cache
+		try:
+			return main.project_squares(main.SQUARES, view)
+		finally:
+			main.projection_cache = None
+
+	attract_cache.clear()
+	for view in attract_views:
+		project_attract(view)
+	attract_cache.hits = attract_cache.misses = attract_cache.evictions = 0
+	items.append(("project_attract_loop", lambda: project_attract(next_attract_view()), 1))
+
+	# Face at each side of the screen for a new view angle every call (replaces closest_face)
+	view_angles = cycle(map(tuple, rng.uniform(0, 360, (64, 3)).tolist()))
+	items.append(("view_faces", lambda: main.view_faces(*view_angles()), 1))
+
+	def turn_moves():
+		for move in turn_sequence:
+			main.turn(move)
+		main.skip_turn_animations()
+
+	turn_sequence = cube.generate_scramble(100, random.Random(SEED))
+	items.append(("turn", turn_moves, len(turn_sequence)))
+
+	items.append(("is_cube_solved", main.is_cube_solved, 1))
+
+	def scramble():
+		main.scramble()
+		main.skip_turn_animations()
+		main.scrambling = False
+
+	items.append(("scramble", scramble, 1))
+
+	# Full redraw with the view turning a degree every frame, then idle frames that the scheduler skips
+	def draw_turning():
+		main.yaxis_rot = (main.yaxis_rot + 1) % 360
+		main.draw_all(main.displayed_cube)
+
+	items.append(("draw_all_turning_view", draw_turning, 1))
+	items.append(("draw_all_idle", lambda: main.draw_all(main.displayed_cube), 1))
+
+	def draw_layer_turn():
+		if not main.turn_queue:
+			main.turn("R")
+		main.update_turn_animation()
+		main.draw_all(main.displayed_cube, squares=main.animated_squares())
+
+	items.append(("draw_all_layer_turn", draw_layer_turn, 1))
+
+	long_sequence = cube.generate_scramble(1000, random.Random(SEED))
+	items.append(("compile_moves_1000", lambda: cube.compile_moves(long_sequence), 1))
+
+	batch_moves = cube.generate_scramble_batch(10000, 25, SEED)
+	batch_cubes = np.tile(cube.SOLVED_CUBE, (10000, 1))
+	items.append(("apply_moves_batch", lambda: cube.apply_moves_batch(batch_cubes, batch_moves), 10000))
+
+	solve_scrambles = cube.generate_scramble_batch(16, 25, SEED)
+	solve_states = cycle(cube.apply_moves_batch(np.tile(cube.SOLVED_CUBE, (16, 1)), solve_scrambles))
+	items.append(("solver_solve", lambda: solver.get_solver().solve(solve_states()), 1))
+
+	return items
+
+
+# --- FUNCTIONS -----------------------------------------------------------------------------------------------
+def git_commit():
+	try:
+		return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+			check=True).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+def run(min_secs, name_filter=None):
+	setup_main()
+	solver.load_tables() # Built once up front so building them isn't timed
+
+	results = {
+		"commit": git_commit(),
+		"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+		"seed": SEED,
+		"python": platform.python_version(),
+		"numpy": np.__version__,
+		"pygame": pygame.version.ver,
+		"platform": platform.platform(),
+		"benchmarks": {},
+	}
+
+	for name, function, ops_per_call in benchmarks():
+		if name_filter and name_filter not in name:
+			continue
+		results["benchmarks"][name] = run_benchmark(function, min_secs, ops_per_call)
+
+	if "project_attract_loop" in results["benchmarks"]:
+		results["projection_cache"] = attract_cache.stats()
+	return results
+
+
+def print_results(results, previous=None):
+	print(f"commit {results['commit']}, python {results['python']}, numpy {results['numpy']}, pygame {results['pygame']}")
+	header = f"{'benchmark':<24} {'ops/s':>12} {'mean us':>10} {'p50 ms':>9} {'p95 ms':>9}"
+	print(header + (f" {'vs ' + str(previous.get('commit')):>14}" if previous else ""))
+
+	for name, result in results["benchmarks"].items():
+		line = f"{name:<24} {result['ops_per_sec']:>12.1f} {result['mean_us']:>10.2f} {result['p50_ms']:>9.3f} " \
+			f"{result['p95_ms']:>9.3f}"
+		if previous and name in previous["benchmarks"]:
+			line += f" {result['ops_per_sec'] / previous['benchmarks'][name]['ops_per_sec']:>13.2f}x"
+		print(line)
+
+	cache = results.get("projection_cache")
+	if cache:
+		print(f"projection cache: {cache['hit_rate']:.1%} hits, {cache['entries']} views, {cache['bytes'] / 2**20:.1f} MB, "
+			f"{cache['evictions']} evictions")
+
+
+def main_cli():
+	parser = argparse.ArgumentParser(description="Benchmark the engine and renderer hot paths")
+	parser.add_argument("--output", help="save the results to this JSON file")
+	parser.add_argument("--compare", help="JSON results of an earlier run to compare ops/s against")
+	parser.add_argument("--filter", help="only run benchmarks whose name contains this")
+	parser.add_argument("--quick", action="store_true", help=f"run each benchmark for {QUICK_MIN_SECS}s instead of {MIN_SECS}s")
+	args = parser.parse_args()
+
+	results = run(QUICK_MIN_SECS if args.quick else MIN_SECS, args.filter)
+
+	previous = None
+	if args.compare:
+		with open(args.compare) as file:
+			previous = json.load(file)
+	print_results(results, previous)
+
+	if args.output:
+		with open(args.output, "w") as file:
+			json.dump(results, file, indent=2)
+
+	pygame.quit()
+
+
+if __name__ == "__main__":
+	main_cli()
@@ -0,0 +1,483 @@
+#
+#    cube.py
+#
+#   Cube state, moves and scrambles without any display, so they can be used
+#   by main.py as well as by scripts, servers and tests that never open a window
+#
+#   Works for any n x n x n cube. Cube states are uint8 arrays of 6*n*n color indices (see CUBE_COLORS),
+#   one per square slot in the cube's geometry (see cube_geometry)
+#
+
+
+# --- IMPORTS -------------------------------------------------------------------------------------------------
+from functools import lru_cache
+import random
+import re
+
+import numpy as np
+
+
+# --- CONSTANTS ------------------------------------------------------------------------------------------------
+BATCH_CHUNK = 3 # Max moves combined into one permutation by apply_moves_batch
+BATCH_TABLE_LIMIT = 2_000_000 # Max entries in the combined permutation table (fewer moves are combined on big cubes)
+
+ALL_MOVES = ["U", "U'", "D", "D'", "F", "F'", "B", "B'", "L", "L'", "R", "R'"] # Outer layer quarter turns
+OPPOSITE_FACES = {"U": "D", "D": "U", "F": "B", "B": "F", "L": "R", "R": "L"}
+
+# Faces in slot order, and the color of each
+FACE_ORDER = ["F", "U", "R", "L", "D", "B"]
+CUBE_COLORS = ["red", "white", "blue", "green", "yellow", "orange"]
+
+# Outward direction of each face
+FACE_NORMALS = {
+	"U": (0, 1, 0),
+	"D": (0, -1, 0),
+	"F": (0, 0, -1),
+	"B": (0, 0, 1),
+	"L": (-1, 0, 0),
+	"R": (1, 0, 0),
+}
+
+# How each face turns: (axis, is the face at the high end of the axis?, rotate around axis by negative amount?)
+FACE_TURNS = {
+	"U": (1, True, True),
+	"D": (1, False, False),
+	"F": (2, False, False),
+	"B": (2, True, True),
+	"L": (0, False, False),
+	"R": (0, True, True),
+}
+
+# Middle slices and whole cube rotations turn the same way as these faces
+SLICE_FACES = {"M": "L", "E": "D", "S": "F"}
+ROTATION_FACES = {"x": "R", "y": "U", "z": "F"}
+
+# e.g. R, R', R2, 2R (second layer from R), Rw or r (two outer layers), 3Rw (three outer layers), M, x
+MOVE_PATTERN = re.compile(r"^(\d*)([UDFBLR]w|[UDFBLRudfblrMESxyz])(2'?|')?$")
+
+
+# --- FUNCTIONS -----------------------------------------------------------------------------------------------
+def rotation_matrix(xdegrees=0, ydegrees=0, zdegrees=0):
+	# Rotation matrix for row vectors (point @ matrix), rotating around z, then x, then y
+	xrads, yrads, zrads = np.radians((xdegrees, ydegrees, zdegrees))
+	xcos, xsin = np.cos(xrads), np.sin(xrads)
+	ycos, ysin = np.cos(yrads), np.sin(yrads)
+	zcos, zsin = np.cos(zrads), np.sin(zrads)
+
+	xrot_matrix = np.array([[1, 0, 0], [0, xcos, -xsin], [0, xsin, xcos]])
+	yrot_matrix = np.array([[ycos, 0, ysin], [0, 1, 0], [-ysin, 0, ycos]])
+	zrot_matrix = np.array([[zcos, -zsin, 0], [zsin, zcos, 0], [0, 0, 1]])
+
+	return yrot_matrix @ xrot_matrix @ zrot_matrix
+
+
+def plane_squares(n, axis, coordinate, normal_sign):
+	# The n*n squares (each 2 units wide) of a whole cross-section of the cube at coordinate on axis (0, 1 or 2),
+	# wound so that (v1 - v0) x (v3 - v0) points towards normal_sign
+	u_axis, v_axis = (axis+1) % 3, (axis+2) % 3
+
+	squares = []
+	for u in range(0, 2*n, 2):
+		for v in range(0, 2*n, 2):
+			corners = [(u, v), (u+2, v), (u+2, v+2), (u, v+2)]
+			if normal_sign < 0:
+				corners.reverse()
+
+			square = []
+			for corner_u, corner_v in corners:
+				vertex = [0, 0, 0]
+				vertex[axis] = coordinate
+				vertex[u_axis] = corner_u
+				vertex[v_axis] = corner_v
+				square.append(vertex)
+			squares.append(square)
+
+	return np.array(squares)
+
+
+@lru_cache(maxsize=None)
+def cube_geometry(n=3):
+	# Geometry and move tables are only built once per cube size
+	return CubeGeometry(n)
+
+
+def generate_scramble(length, rng=random, n=3):
+	# Random moves without redundant sequences: never the same layer twice in a row (R R', R R R R)
+	# and never a layer, another layer on the same axis, then the first layer again (R L R')
+	geometry = cube_geometry(n)
+
+	moves = []
+	while len(moves) < length:
+		move = rng.choice(geometry.moves)
+
+		if moves and geometry.move_groups[move] == geometry.move_groups[moves[-1]]:
+			continue
+		if len(moves) >= 2 and geometry.move_groups[move] == geometry.move_groups[moves[-2]] and \
+			geometry.move_axes[moves[-1]] == geometry.move_axes[move]:
+			continue
+
+		moves.append(move)
+
+	return moves
+
+
+def apply_moves(cube, moves, n=3):
+	# Returns the cube with every move applied (in one indexing operation, see compile_moves), nothing is drawn
+	return cube[compile_moves(moves, n)[1]]
+
+
+def parse_moves(text):
+	# Splits a sequence such as "R U2 R' 2Lw x'" into moves, raises ValueError on anything that isn't a move
+	moves = text.split()
+	for move in moves:
+		if not MOVE_PATTERN.match(move):
+			raise ValueError(f"Unknown move: {move}")
+	return moves
+
+
+def simplify_moves(moves, n=3):
+	# Cancels and merges moves that turn the same layers, also across moves on the same axis (which commute):
+	# R R R -> R', R R' -> nothing, R L R -> R2 L, R U U' R' -> nothing
+	geometry = cube_geometry(n)
+
+	# [move without amount, axis, layers, quarter turns around the axis (0-3), direction of the move without amount]
+	simplified = []
+	for move in moves:
+		prefix, axis, layers, turns, direction = geometry.move_turns(move)
+
+		# Look back through the moves on the same axis for one turning the same layers
+		merged = False
+		for index in range(len(simplified) - 1, -1, -1):
+			entry = simplified[index]
+			if entry[1] != axis:
+				break
+			if entry[2] == layers:
+				entry[3] = (entry[3] + turns) % 4
+				if entry[3] == 0:
+					del simplified[index]
+				merged = True
+				break
+
+		if not merged:
+			simplified.append([prefix, axis, layers, turns % 4, direction])
+
+	return [prefix + {1: "", 2: "2", 3: "'"}[turns * direction % 4] for prefix, _, _, turns, direction in simplified]
+
+
+def compile_moves(moves, n=3):
+	# Returns the simplified moves (see simplify_moves) and a single permutation that applies all of them:
+	# new_cube = cube[permutation], however long the sequence is
+	# moves is a list of moves or a string of moves separated by spaces
+	if isinstance(moves, str):
+		moves = parse_moves(moves)
+
+	geometry = cube_geometry(n)
+	moves = simplify_moves(moves, n)
+
+	permutation = np.arange(len(geometry.solved))
+	for move in moves:
+		permutation = permutation[geometry.permutation(move)]
+
+	return moves, permutation
+
+
+def generate_scramble_batch(count, length, rng=None, n=3):
+	# (count, length) array of indices into cube_geometry(n).moves, following the same rules as generate_scramble
+	geometry = cube_geometry(n)
+	group_ids = {group: index for index, group in enumerate(dict.fromkeys(geometry.move_groups.values()))}
+	groups = np.array([group_ids[geometry.move_groups[move]] for move in geometry.moves])
+	axes = np.array([geometry.move_axes[move] for move in geometry.moves])
+
+	rng = np.random.default_rng(rng)
+	moves = rng.integers(len(geometry.moves), size=(count, length))
+
+	for step in range(length):
+		while True:
+			step_groups = groups[moves[:, step]]
+			redundant = np.zeros(count, dtype=bool)
+			if step >= 1:
+				redundant |= step_groups == groups[moves[:, step-1]]
+			if step >= 2:
+				redundant |= (step_groups == groups[moves[:, step-2]]) & \
+					(axes[moves[:, step-1]] == axes[moves[:, step]])
+
+			if not redundant.any():
+				break
+			moves[redundant, step] = rng.integers(len(geometry.moves), size=redundant.sum())
+
+	return moves
+
+
+def apply_moves_batch(cubes, moves, n=3):
+	# cubes is a (B, 6*n*n) array of cube states
+	# moves is either one list of moves for every cube, or a (B, L) array of indices into cube_geometry(n).moves,
+	# one row per cube
+	geometry = cube_geometry(n)
+	cubes = np.asarray(cubes)
+
+	if len(moves) == 0: # No moves (an empty list, or no rows of moves)
+		return cubes
+
+	if isinstance(moves[0], str):
+		# Same moves for every cube: combine them into one permutation first
+		return cubes[:, apply_moves(np.arange(cubes.shape[1]), moves, n)]
+
+	moves = np.asarray(moves)
+	rows = np.arange(len(cubes))[:, None]
+	length = moves.shape[1]
+
+	# Apply several moves per gather using the combined permutation of those moves
+	chunk = batch_chunk(n)
+	chunk_table = move_sequence_table(chunk, n)
+	chunked_length = length - length % chunk
+
+	for step in range(0, chunked_length, chunk):
+		sequence_index = 0
+		for move in moves[:, step:step+chunk].T:
+			sequence_index = sequence_index * len(geometry.moves) + move
+		cubes = cubes[rows, chunk_table[sequence_index]]
+
+	for step in range(chunked_length, length):
+		cubes = cubes[rows, geometry.move_table[moves[:, step]]]
+
+	return cubes
+
+
+def batch_chunk(n=3):
+	# How many moves apply_moves_batch combines, keeping the combined table under BATCH_TABLE_LIMIT entries
+	geometry = cube_geometry(n)
+	chunk = 1
+	while chunk < BATCH_CHUNK and len(geometry.moves) ** (chunk+1) * len(geometry.solved) <= BATCH_TABLE_LIMIT:
+		chunk += 1
+	return chunk
+
+
+@lru_cache(maxsize=None)
+def move_sequence_table(length, n=3):
+	# Combined permutation of every sequence of length moves,
+	# the sequence's move indices are the digits of the row in base len(moves)
+	move_table = cube_geometry(n).move_table
+	table = move_table
+	for _ in range(length - 1):
+		table = table[:, move_table].reshape(-1, move_table.shape[1])
+	return table
+
+
+def solved_batch(cubes, n=3):
+	# Boolean array, True for every cube in the (B, 6*n*n) array whose faces are each a single color
+	faces = np.asarray(cubes).reshape(len(cubes), 6, n*n)
+	return (faces == faces[:, :, :1]).all(axis=(1, 2))
+
+
+# --- GEOMETRY -------------------------------------------------------------------------------------------------
+class CubeGeometry:
+	# Square layout and move tables of an n x n x n cube, spanning 0..2n on every axis
+
+	def __init__(self, n):
+		if n < 2:
+			raise ValueError(f"Cube size must be at least 2, got {n}")
+
+		self.n = n
+
+		# Squares are grouped by face in FACE_ORDER, n*n per face
+		self.squares = np.concatenate([
+			plane_squares(n, FACE_TURNS[face][0], 2*n if FACE_TURNS[face][1] else 0, 1 if FACE_TURNS[face][1] else -1)
+			for face in FACE_ORDER
+		])
+		self.square_faces = np.repeat(np.arange(6), n*n)
+
+		self.solved = np.repeat(np.arange(6, dtype=np.uint8), n*n)
+		self.solved.setflags(write=False)
+
+		# Layer of every square along each axis
+		self.square_layers = np.clip(self.squares.mean(axis=1) // 2, 0, n-1).astype(int)
+
+		self._slot_lookup = {tuple(sorted(map(tuple, square))): index for index, square in enumerate(self.squares.tolist())}
+		self._permutations = {}
+		self._move_turns = {}
+
+		# Quarter turns used for scrambles and the batch functions: outer layers, then inner layers up to the middle
+		self.moves = list(ALL_MOVES)
+		for depth in range(2, n//2 + 1):
+			for face in ["U", "D", "F", "B", "L", "R"]:
+				self.moves += [f"{depth}{face}", f"{depth}{face}'"]
+
+		# Moves on the same group turn the same layers, moves on the same axis commute
+		self.move_groups = {}
+		self.move_axes = {}
+		for move in self.moves:
+			axis, layers, _ = self.move_layers(move)
+			self.move_axes[move] = axis
+			self.move_groups[move] = (axis, tuple(layers))
+
+		self.move_permutations = {move: self.permutation(move) for move in self.moves}
+		self.move_table = np.array([self.move_permutations[move] for move in self.moves])
+
+	def move_turns(self, move):
+		# Returns (move without its amount, axis, layers, quarter turns around the axis, direction of a quarter turn
+		# of the move without its amount), the quarter turns and direction being 1 or -1 each way around the axis
+		if move not in self._move_turns:
+			depth, base, _ = MOVE_PATTERN.match(move).groups()
+			axis, layers, degrees = self.move_layers(move)
+			direction = self.move_layers(depth + base)[2] // 90
+			self._move_turns[move] = (depth + base, axis, tuple(layers.tolist()), degrees // 90, direction)
+
+		return self._move_turns[move]
+
+	def move_layers(self, move):
+		# Returns (axis, layer indices along the axis, signed degrees) of any move in standard notation
+		match = MOVE_PATTERN.match(move)
+		if not match:
+			raise ValueError(f"Unknown move: {move}")
+
+		depth, base, amount = match.groups()
+		n = self.n
+
+		if base in ROTATION_FACES:
+			face = ROTATION_FACES[base]
+			layers = list(range(n))
+		elif base in SLICE_FACES:
+			if n % 2 == 0:
+				raise ValueError(f"{base} needs a middle layer, {n}x{n} cubes have none")
+			face = SLICE_FACES[base]
+			layers = [n // 2]
+		else:
+			face = base[0].upper()
+			wide = base.endswith("w") or base.islower()
+			depth = int(depth) if depth else (2 if wide else 1)
+			if not 1 <= depth <= n:
+				raise ValueError(f"{move} is deeper than a {n}x{n} cube")
+
+			# Layers counted from the face
+			layers = list(range(depth)) if wide else [depth-1]
+			if FACE_TURNS[face][1]:
+				layers = [n-1-layer for layer in layers]
+
+		axis, _, backwards_rot = FACE_TURNS[face]
+		quarter_turns = {None: 1, "'": -1}.get(amount, 2)
+		degrees = 90 * quarter_turns * (-1 if backwards_rot else 1)
+
+		return axis, np.array(sorted(layers)), degrees
+
+	def layer_rotation(self, move, degrees):
+		# Returns the squares in the layers turned by move, and the matrix and center that turn them by degrees
+		# (degrees is how far along the move is, between 0 and turn_degrees(move))
+		axis, layers, move_degrees = self.move_layers(move)
+
+		angles = [0, 0, 0]
+		angles[axis] = np.copysign(degrees, move_degrees)
+
+		layer_squares = np.nonzero(np.isin(self.square_layers[:, axis], layers))[0]
+
+		return layer_squares, rotation_matrix(*angles), np.array([self.n, self.n, self.n])
+
+	def turn_degrees(self, move):
+		# How far a move turns its layers (90 or 180)
+		return abs(self.move_layers(move)[2])
+
+	def permutation(self, move):
+		# Index permutation that applies a move to a cube state: new_cube = cube[permutation]
+		if move not in self._permutations:
+			layer_squares, matrix, center = self.layer_rotation(move, self.turn_degrees(move))
+
+			permutation = np.arange(len(self.squares))
+			for index in layer_squares:
+				turned_square = np.rint((self.squares[index] - center) @ matrix + center).astype(int)
+				permutation[self._slot_lookup[tuple(sorted(map(tuple, turned_square.tolist())))]] = index
+
+			self._permutations[move] = permutation
+
+		return self._permutations[move]
+
+	def layer_interior(self, move):
+		# Cross-sections exposed while the move's layers turn: (squares of the rest of the cube, squares of the layers)
+		axis, layers, _ = self.move_layers(move)
+
+		rest_squares = []
+		layer_squares = []
+		if layers[0] > 0:
+			rest_squares.append(plane_squares(self.n, axis, 2*layers[0], 1))
+			layer_squares.append(plane_squares(self.n, axis, 2*layers[0], -1))
+		if layers[-1] < self.n-1:
+			rest_squares.append(plane_squares(self.n, axis, 2*(layers[-1]+1), -1))
+			layer_squares.append(plane_squares(self.n, axis, 2*(layers[-1]+1), 1))
+
+		if not rest_squares:
+			# Whole cube rotation
+			empty = np.zeros((0, 4, 3), dtype=int)
+			return empty, empty
+
+		return np.concatenate(rest_squares), np.concatenate(layer_squares)
+
+
+# --- CUBE -----------------------------------------------------------------------------------------------------
+class Cube:
+	# A single cube and its moves
+	# face_counts (how many squares of each color are on each face) is kept up to date by every move,
+	# so is_solved is O(1) for any size
+	# version goes up on every change, so callers can tell when the state has changed
+
+	def __init__(self, n=3, state=None):
+		self.geometry = cube_geometry(n)
+		self.n = n
+		self.version = 0
+		self.state = self.geometry.solved if state is None else state
+
+	@property
+	def state(self):
+		return self._state
+
+	@state.setter
+	def state(self, state):
+		self._state = np.array(state, dtype=np.uint8)
+		self.face_counts = np.bincount(self.geometry.square_faces*6 + self._state, minlength=36)
+		self.face_colors = np.count_nonzero(self.face_counts)
+		self.version += 1
+
+	def turn(self, move):
+		# move is U, U', F, F', etc. (any notation move_layers understands)
+		# Only the squares the move changes are counted again
+		permutation = self.geometry.permutation(move)
+		slots = self.geometry.square_faces * 6
+
+		before = slots + self._state
+		self._state = self._state[permutation]
+		after = slots + self._state
+
+		moved = before != after
+		self.face_counts += np.bincount(after[moved], minlength=36) - np.bincount(before[moved], minlength=36)
+		self.face_colors = np.count_nonzero(self.face_counts)
+		self.version += 1
+
+	def apply(self, moves):
+		self.apply_permutation(compile_moves(moves, self.n)[1])
+
+	def apply_permutation(self, permutation):
+		# permutation from compile_moves, applied in one step
+		self.state = self._state[permutation]
+
+	def scramble(self, length, rng=random):
+		# Applies a random scramble and returns its moves
+		moves = generate_scramble(length, rng, self.n)
+		self.apply(moves)
+		return moves
+
+	def is_solved(self):
+		# Every face has a single color once there are only 6 (face, color) pairs left
+		return self.face_colors == 6
+
+	def reset(self):
+		self.state = self.geometry.solved
+
+	def copy(self):
+		return Cube(self.n, self._state)
+
+	def key(self):
+		# Hashable snapshot of the state
+		return self._state.tobytes()
+
+
+# --- 3x3 TABLES -----------------------------------------------------------------------------------------------
+SQUARES = cube_geometry(3).squares
+SOLVED_CUBE = cube_geometry(3).solved
+MOVE_PERMUTATIONS = cube_geometry(3).move_permutations
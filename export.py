@@ -0,0 +1,175 @@
+#
+#    export.py
+#
+#   Exports a recorded session (see session.py) as video frames, rendered offscreen at a fixed frame rate
+#
+#   Usage: python export.py sessions/20240701-120000.vcl OUTPUT [--fps 60] [--speed 1] [--workers 4]
+#   OUTPUT is a folder for a PNG sequence, a .raw file or - (stdout) for raw RGB frames to pipe into an encoder,
+#   or a video file (.mp4, .mkv, .webm, .mov) encoded by ffmpeg, which then has to be installed
+#
+#   Frames are drawn at session times frame / fps * speed, never waiting for the clock, so every frame is exported
+#   however long it takes to draw. Saving runs on worker threads (PNG) or a writer thread (raw frames),
+#   so encoding overlaps with drawing the next frames
+#
+
+
+# --- IMPORTS -------------------------------------------------------------------------------------------------
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "hide")
+
+import pygame
+
+import main
+from session import SessionLog
+
+
+# --- CONSTANTS ------------------------------------------------------------------------------------------------
+DEFAULT_FPS = 60
+VIDEO_EXTENSIONS = (".mp4", ".mkv", ".webm", ".mov")
+RAW_EXTENSIONS = (".raw", ".rgb")
+QUEUED_FRAMES = 32 # Frames drawn ahead of the writer before drawing waits for it
+
+
+# --- FUNCTIONS -----------------------------------------------------------------------------------------------
+def render_frames(log, fps, speed):
+	# Yields (frame number, surface) for every frame of the session, drawn on one offscreen surface
+	# Frames that would look the same as the one before aren't drawn again
+	playback = main.prepare_replay(log)
+	surface = pygame.Surface((main.SCREEN_WIDTH, main.SCREEN_HEIGHT))
+	last_frame = None
+
+	for index in range(frame_count(log, fps, speed)):
+		playback.seek(index / fps * speed)
+		state, squares, angle = main.show_replay(playback)
+
+		frame = (playback.view, playback.cube.key(), angle, main.hud_texts(None, show_fps=False))
+		if frame != last_frame:
+			main.render_frame(surface, state, squares, show_fps=False)
+			last_frame = frame
+
+		yield index, surface
+
+
+def frame_count(log, fps, speed):
+	return int(log.duration / speed * fps) + 1
+
+
+def export_png(log, directory, fps, speed, workers=None):
+	# Saves every frame as directory/frame_000000.png, ... on a thread pool
+	os.makedirs(directory, exist_ok=True)
+	workers = workers or os.cpu_count()
+	saving = deque()
+
+	with ThreadPoolExecutor(max_workers=workers) as executor:
+		for index, surface in render_frames(log, fps, speed):
+			saving.append(executor.submit(pygame.image.save, surface.copy(),
+				os.path.join(directory, f"frame_{index:06d}.png")))
+
+			# Wait for the oldest frames when the workers fall behind, which also raises their errors
+			while len(saving) > workers * 2:
+				saving.popleft().result()
+
+		for future in saving:
+			future.result()
+
+
+def export_raw(log, file, fps, speed):
+	# Writes every frame to file as raw RGB (SCREEN_WIDTH x SCREEN_HEIGHT x 3 bytes) on a writer thread
+	frames = Queue(maxsize=QUEUED_FRAMES)
+	errors = []
+
+	def write_frames():
+		while True:
+			frame = frames.get()
+			if frame is None:
+				break
+			if not errors:
+				try:
+					file.write(frame)
+				except OSError as error: # e.g. the encoder reading the pipe quit
+					errors.append(error)
+
+	writer = threading.Thread(target=write_frames, daemon=True)
+	writer.start()
+	try:
+		for index, surface in render_frames(log, fps, speed):
+			if errors:
+				break
+			frames.put(pygame.image.tobytes(surface, "RGB"))
+	finally:
+		frames.put(None)
+		writer.join()
+
+	if errors:
+		raise errors[0]
+
+
+def export_video(log, output, fps, speed):
+	# Pipes raw frames into ffmpeg to encode output
+	ffmpeg = shutil.which("ffmpeg")
+	if ffmpeg is None:
+		raise SystemExit("ffmpeg wasn't found, export a PNG sequence or raw frames instead")
+
+	process = subprocess.Popen([
+		ffmpeg, "-loglevel", "error", "-y",
+		"-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{main.SCREEN_WIDTH}x{main.SCREEN_HEIGHT}", "-r", str(fps),
+		"-i", "-", "-pix_fmt", "yuv420p", output,
+	], stdin=subprocess.PIPE)
+	try:
+		export_raw(log, process.stdin, fps, speed)
+	finally:
+		process.stdin.close()
+		process.wait()
+
+
+def export(log_path, output, fps=DEFAULT_FPS, speed=1, workers=None, log=sys.stderr):
+	# Exports the session to output (see the usage above), returns how many times faster than real time it went
+	session_log = SessionLog(log_path)
+	pygame.init()
+	start = time.perf_counter()
+
+	if output == "-":
+		export_raw(session_log, sys.stdout.buffer, fps, speed)
+	elif output.lower().endswith(RAW_EXTENSIONS):
+		with open(output, "wb") as file:
+			export_raw(session_log, file, fps, speed)
+	elif output.lower().endswith(VIDEO_EXTENSIONS):
+		export_video(session_log, output, fps, speed)
+	else:
+		export_png(session_log, output, fps, speed, workers)
+
+	elapsed = time.perf_counter() - start
+	frames = frame_count(session_log, fps, speed)
+	video_seconds = frames / fps
+	print(f"Exported {frames} frames ({video_seconds:.1f}s of video at {fps} FPS) in {elapsed:.1f}s: "
+		f"{frames / elapsed:.1f} frames/s, {video_seconds / elapsed:.1f}x real time", file=log)
+
+	pygame.quit()
+	return video_seconds / elapsed
+
+
+def main_cli():
+	parser = argparse.ArgumentParser(description="Export a recorded session as video frames")
+	parser.add_argument("log", help="session log (.vcl) to export")
+	parser.add_argument("output", help="folder for PNG frames, .raw file or - for raw RGB frames, or a video file")
+	parser.add_argument("--fps", type=int, default=DEFAULT_FPS, help="frames per second of the video")
+	parser.add_argument("--speed", type=float, default=1, help="session seconds per second of video")
+	parser.add_argument("--workers", type=int, default=None, help="threads saving PNG frames (default: one per core)")
+	args = parser.parse_args()
+
+	export(args.log, args.output, args.fps, args.speed, args.workers)
+
+
+if __name__ == "__main__":
+	main_cli()
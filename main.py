@@ -19,10 +19,15 @@
 
 
 # --- IMPORTS -------------------------------------------------------------------------------------------------
-from os import environ, path
-from random import choice, randint
-from time import sleep
+import argparse
+from collections import deque
+from functools import lru_cache
+from math import ceil, log
+from os import environ, makedirs, path
+import random
+from time import perf_counter, strftime
 import sys
+import threading
 
 try:
 	environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "hide"
@@ -33,6 +38,14 @@ except (ModuleNotFoundError, ImportError):
 	print("Missing one or more required packages.")
 	print("Run \"pip install -r requirements.txt\" and then run this file again.")
 	sys.exit()
+
+from profiler import FrameProfiler
+from projection_cache import ProjectionCache
+from session import MAX_SPEED, MIN_SPEED, TIMER_CANCEL, TIMER_START, TIMER_STOP, Replay, SessionLog, SessionRecorder, \
+	print_summary
+from tweens import Tweens
+from cube import CUBE_COLORS, FACE_NORMALS, OPPOSITE_FACES, Cube, compile_moves, cube_geometry, rotation_matrix
+import solver
 	
 # Virtual Cube configuration settings #######################################################################################
 
@@ -44,8 +57,15 @@ FOCAL_LENGTH = 450
 # DISPLAY SETTINGS
 SCREEN_WIDTH = 600
 SCREEN_HEIGHT = 720
-FPS = 60
+FPS = 60 # Frames drawn per second with RENDER_MODE "FIXED"
+RENDER_MODE = "FIXED" # "FIXED" draws FPS frames a second, "VSYNC" draws one frame per display refresh
+DISPLAY_REFRESH_RATE = 60 # Frames per second of "VSYNC" mode when the display's refresh rate can't be read
+SIMULATION_HZ = 60 # Steps per second of spinning, turning and fading, which run at the same speed at any frame rate
+MAX_SIMULATION_STEPS = 10 # Most steps run per frame, time past that is dropped so a stall doesn't snowball
 SHOW_FPS = True
+TEXT_CACHE_SIZE = 64 # How many rendered texts to keep (static labels plus recent FPS and timer values)
+PROJECTION_CACHE_MB = 0 # Memory for projected views kept to draw again without computing them, 0 turns the cache off
+PROJECTION_CACHE_STEP = 0.25 # Degrees the view angles of a resting cube snap to when the projection cache is on
 
 # COLORS
 COLORS  = {
@@ -67,10 +87,26 @@ COLORS  = {
 
 
 # CUBE SETTINGS
+CUBE_SIZE = 3 # Number of layers on each side (2 or more)
+SOLVE_KEY = pygame.K_RETURN # Shows a solution from the current state (3x3 only, the first solve loads the solver's tables)
 SPIN_FACTOR = 0.9 # Higher = faster and vice versa, between 0 and 1 (when cube is spun with the mouse)
 NORMAL_CUBE_TURN_SPEED = 10 # Should be a divisor of 90 (or very close to it)
 SCRAMBLE_CUBE_TURN_SPEED = 18 # Should be a divisor of 90 (or very close to it)
+MAX_TURN_LAG_FRAMES = 12 # Most simulation steps the shown cube may lag behind typed moves, queued turns speed up (or snap) to keep up
 SCRAMBLE_RANGE = (20, 30) # Min and max number of times to scramble
+SCRAMBLE_REPLAY = False # Show the scramble being made instead of applying it at once (click Scramble again to skip to the end)
+
+# PROFILER SETTINGS
+PROFILER_KEY = pygame.K_F3 # Shows or hides the frame-time profiler
+PROFILER_EXPORT_KEY = pygame.K_F4 # Saves the profiled frames to PROFILER_EXPORT_PATH.csv and .json
+PROFILER_EXPORT_PATH = "frame_profile"
+PROFILER_WINDOW = 600 # Frames kept for the percentiles and the export
+
+# SESSION SETTINGS
+RECORD_SESSIONS = False # Records every move, view change and timer event to SESSION_DIRECTORY (watch with --replay)
+SESSION_DIRECTORY = path.join(path.dirname(__file__), "sessions") # Next to main.py, wherever it's run from
+CHECKPOINT_SECS = 5 # How often the whole state is saved in the log, so replays can jump anywhere quickly
+REPLAY_SEEK_SECS = 10 # How far the left and right arrow keys jump in a replay
 
 # INSTRUCTIONS SETTINGS
 INSTRUCTIONS_DELAY_SECS = 0.5 # How long to wait before showing instructions
@@ -83,7 +119,6 @@ RESET_TYPE = "FADE" # "GLIDE" or "FADE"
 
 if RESET_TYPE == "FADE":
 	RESET_FADE_SECONDS = 0.25 # How long to fade out
-	RESET_FADE_FRAMES = int(RESET_FADE_SECONDS*FPS)
 	RESET_PAUSE_SECONDS = 0.25 # How long to pause after fading out before fading in again
 
 
@@ -91,118 +126,59 @@ if RESET_TYPE == "FADE":
 
 
 # --- CONSTANTS ------------------------------------------------------------------------------------------------
-ALL_MOVES = ["U", "U'", "D", "D'", "F", "F'", "B", "B'", "L", "L'", "R", "R'"] # MES excluded
-
-# To be scaled up by 50x for 3D coordinates of each square
-SOLVED_CUBE = {
-	# Top layer on front (red)
-	((0, 4, 0), (2, 4, 0), (2, 6, 0), (0, 6, 0)): COLORS["red"],
-	((2, 4, 0), (4, 4, 0), (4, 6, 0), (2, 6, 0)): COLORS["red"],
-	((4, 4, 0), (6, 4, 0), (6, 6, 0), (4, 6, 0)): COLORS["red"],
-	
-	# Middle layer on front (red)
-	((0, 2, 0), (2, 2, 0), (2, 4, 0), (0, 4, 0)): COLORS["red"],
-	((2, 2, 0), (4, 2, 0), (4, 4, 0), (2, 4, 0)): COLORS["red"],
-	((4, 2, 0), (6, 2, 0), (6, 4, 0), (4, 4, 0)): COLORS["red"],
-	
-	# Bottom layer on front (red)
-	((0, 0, 0), (2, 0, 0), (2, 2, 0), (0, 2, 0)): COLORS["red"],
-	((2, 0, 0), (4, 0, 0), (4, 2, 0), (2, 2, 0)): COLORS["red"],
-	((4, 0, 0), (6, 0, 0), (6, 2, 0), (4, 2, 0)): COLORS["red"],
-
-	# Closest layer on top (white)
-	((0, 6, 0), (2, 6, 0), (2, 6, 2), (0, 6, 2)): COLORS["white"],
-	((2, 6, 0), (4, 6, 0), (4, 6, 2), (2, 6, 2)): COLORS["white"],
-	((4, 6, 0), (6, 6, 0), (6, 6, 2), (4, 6, 2)): COLORS["white"],
-	
-	# Middle layer on top (white)
-	((0, 6, 2), (2, 6, 2), (2, 6, 4), (0, 6, 4)): COLORS["white"],
-	((2, 6, 2), (4, 6, 2), (4, 6, 4), (2, 6, 4)): COLORS["white"],
-	((4, 6, 2), (6, 6, 2), (6, 6, 4), (4, 6, 4)): COLORS["white"],
-
-	# Farthest layer on top (white)
-	((0, 6, 4), (2, 6, 4), (2, 6, 6), (0, 6, 6)): COLORS["white"],
-	((2, 6, 4), (4, 6, 4), (4, 6, 6), (2, 6, 6)): COLORS["white"],
-	((4, 6, 4), (6, 6, 4), (6, 6, 6), (4, 6, 6)): COLORS["white"],
-
-	# Top layer on right side (blue)
-	((6, 4, 2), (6, 6, 2), (6, 6, 0), (6, 4, 0)): COLORS["blue"],
-	((6, 4, 4), (6, 6, 4), (6, 6, 2), (6, 4, 2)): COLORS["blue"],
-	((6, 4, 6), (6, 6, 6), (6, 6, 4), (6, 4, 4)): COLORS["blue"],
-
-	# Middle layer on right side (blue)
-	((6, 2, 2), (6, 4, 2), (6, 4, 0), (6, 2, 0)): COLORS["blue"],
-	((6, 2, 4), (6, 4, 4), (6, 4, 2), (6, 2, 2)): COLORS["blue"],
-	((6, 2, 6), (6, 4, 6), (6, 4, 4), (6, 2, 4)): COLORS["blue"],
-
-	# Bottom layer on right side (blue)
-	((6, 0, 2), (6, 2, 2), (6, 2, 0), (6, 0, 0)): COLORS["blue"],
-	((6, 0, 4), (6, 2, 4), (6, 2, 2), (6, 0, 2)): COLORS["blue"],
-	((6, 0, 6), (6, 2, 6), (6, 2, 4), (6, 0, 4)): COLORS["blue"],
-
-	# Top layer on left side (green)
-	((0, 4, 6), (0, 6, 6), (0, 6, 4), (0, 4, 4)): COLORS["green"],
-	((0, 4, 4), (0, 6, 4), (0, 6, 2), (0, 4, 2)): COLORS["green"],
-	((0, 4, 2), (0, 6, 2), (0, 6, 0), (0, 4, 0)): COLORS["green"],
-
-	# Middle layer on left side (green)
-	((0, 2, 6), (0, 4, 6), (0, 4, 4), (0, 2, 4)): COLORS["green"],
-	((0, 2, 4), (0, 4, 4), (0, 4, 2), (0, 2, 2)): COLORS["green"],
-	((0, 2, 2), (0, 4, 2), (0, 4, 0), (0, 2, 0)): COLORS["green"],
-
-	# Bottom layer on left side (green)
-	((0, 0, 6), (0, 2, 6), (0, 2, 4), (0, 0, 4)): COLORS["green"],
-	((0, 0, 4), (0, 2, 4), (0, 2, 2), (0, 0, 2)): COLORS["green"],
-	((0, 0, 2), (0, 2, 2), (0, 2, 0), (0, 0, 0)): COLORS["green"],
-
-	# Closest layer on bottom (yellow)
-	((0, 0, 0), (2, 0, 0), (2, 0, 2), (0, 0, 2)): COLORS["yellow"],
-	((2, 0, 0), (4, 0, 0), (4, 0, 2), (2, 0, 2)): COLORS["yellow"],
-	((4, 0, 0), (6, 0, 0), (6, 0, 2), (4, 0, 2)): COLORS["yellow"],
-
-	# Middle layer on bottom (yellow)
-	((0, 0, 2), (2, 0, 2), (2, 0, 4), (0, 0, 4)): COLORS["yellow"],
-	((2, 0, 2), (4, 0, 2), (4, 0, 4), (2, 0, 4)): COLORS["yellow"],
-	((4, 0, 2), (6, 0, 2), (6, 0, 4), (4, 0, 4)): COLORS["yellow"],
-
-	# Farthest layer on bottom (yellow)
-	((0, 0, 4), (2, 0, 4), (2, 0, 6), (0, 0, 6)): COLORS["yellow"],
-	((2, 0, 4), (4, 0, 4), (4, 0, 6), (2, 0, 6)): COLORS["yellow"],
-	((4, 0, 4), (6, 0, 4), (6, 0, 6), (4, 0, 6)): COLORS["yellow"],
-	
-	# Orange face in order when looking directly at it
-
-	# Top layer on back (orange)
-	((4, 4, 6), (6, 4, 6), (6, 6, 6), (4, 6, 6)): COLORS["orange"],
-	((2, 4, 6), (4, 4, 6), (4, 6, 6), (2, 6, 6)): COLORS["orange"],
-	((0, 4, 6), (2, 4, 6), (2, 6, 6), (0, 6, 6)): COLORS["orange"],
-
-	# Middle layer on back (orange)
-	((4, 2, 6), (6, 2, 6), (6, 4, 6), (4, 4, 6)): COLORS["orange"],
-	((2, 2, 6), (4, 2, 6), (4, 4, 6), (2, 4, 6)): COLORS["orange"],
-	((0, 2, 6), (2, 2, 6), (2, 4, 6), (0, 4, 6)): COLORS["orange"],
-
-	# Bottom layer on back (orange)
-	((4, 0, 6), (6, 0, 6), (6, 2, 6), (4, 2, 6)): COLORS["orange"],
-	((2, 0, 6), (4, 0, 6), (4, 2, 6), (2, 2, 6)): COLORS["orange"],
-	((0, 0, 6), (2, 0, 6), (2, 2, 6), (0, 2, 6)): COLORS["orange"],
-
-}
-
-# used to calculate closest face
-SOLVED_CENTERS = {
-	((2, 2, 0), (4, 2, 0), (4, 4, 0), (2, 4, 0)): COLORS["red"],
-	((2, 6, 2), (4, 6, 2), (4, 6, 4), (2, 6, 4)): COLORS["white"],
-	((6, 2, 4), (6, 4, 4), (6, 4, 2), (6, 2, 2)): COLORS["blue"],
-	((0, 2, 4), (0, 4, 4), (0, 4, 2), (0, 2, 2)): COLORS["green"],
-	((2, 0, 2), (4, 0, 2), (4, 0, 4), (2, 0, 4)): COLORS["yellow"],
-	((2, 2, 6), (4, 2, 6), (4, 4, 6), (2, 4, 6)): COLORS["orange"],
+SIMULATION_STEP = 1 / SIMULATION_HZ # Seconds
+CAMERA_POSITION = np.array([CAMERA_X, CAMERA_Y, -FOCAL_LENGTH]) # Eye position used by get_projection
+
+CUBE_PALETTE = [COLORS[color] for color in CUBE_COLORS]
+
+GEOMETRY = cube_geometry(CUBE_SIZE)
+SQUARES = GEOMETRY.squares
+SQUARE_SCALE = 150 / CUBE_SIZE # Screen units per geometry unit, so every size is 300 wide
+
+# Side of the screen turned by each key
+KEY_SIDES = {
+	pygame.K_f: "front",
+	pygame.K_b: "back",
+	pygame.K_u: "top",
+	pygame.K_d: "bottom",
+	pygame.K_l: "left",
+	pygame.K_r: "right",
 }
 
 # --- VARIABLES ------------------------------------------------------------------------------------------------
-rubiks_cube = SOLVED_CUBE.copy()
+rubiks_cube = Cube(CUBE_SIZE)
 cube_turn_speed = NORMAL_CUBE_TURN_SPEED
-centers = SOLVED_CENTERS.copy()
+
+# Turn animation: moves are applied to rubiks_cube right away and queued here to be shown on displayed_cube
+displayed_cube = GEOMETRY.solved.copy()
+turn_queue = deque() # [move, degrees per frame] of every move not fully shown yet, oldest first
+turn_angle = 0 # How far the oldest queued move has turned on screen
+finished_turns = 0 # Number of moves fully shown so far
+animation_frames = 0 # Number of update_turn_animation calls (simulation steps) so far
+typed_deadlines = deque() # (turn number, animation frame it has to be shown by) of typed moves, oldest first
+
+# Render scheduling: what the last frame showed, so unchanged frames can be skipped
+scene_layer = None # Last drawn scene without the FPS and timer texts
+last_scene = None
+last_hud = None
+last_hud_rects = []
+cube_layer = None # Opaque cube drawn on its own, faded as a whole during resets
+cube_layer_key = None
+overlay_layer = None # Black layer that darkens the start screen
+render_stats = {"rendered": 0, "partial": 0, "skipped": 0} # Frames fully drawn, with only texts redrawn, and skipped
+projection_cache = ProjectionCache(PROJECTION_CACHE_MB * 2**20, PROJECTION_CACHE_STEP) if PROJECTION_CACHE_MB else None
+session = None # SessionRecorder of this session, if RECORD_SESSIONS
+solve_job = None # Solve running on the solver thread: the cube and version it solves, and its moves once done
+replay_timer = None # Seconds shown by the timer while a replay is shown, instead of the time since start_time
+tweens = Tweens() # Transitions advanced by the simulation steps: reset fades and view glides
+cube_opacity = 100 # Percent, lowered while the cube fades out and in on a reset
+
+render_fps = FPS # Frames drawn per second, the display's refresh rate in "VSYNC" mode
+profiler = FrameProfiler(FPS, PROFILER_WINDOW) # Off until PROFILER_KEY is pressed
+
+# Keyboard input: every key press becomes a move, none are dropped while moves are being shown
+input_moves = deque() # (move, time of the key press) of moves typed but not turned yet
+pending_inputs = deque() # (turn number, time of the key press) of typed moves not shown on screen yet
 
 # --- OBJECTS --------------------------------------------------------------------------------------------------
 reset_button = pygame.Rect(SCREEN_WIDTH/5, 540, SCREEN_WIDTH/5*3, 70)
@@ -221,16 +197,6 @@ def real(x,y):
 	return (x+SCREEN_WIDTH/4, SCREEN_WIDTH-y-SCREEN_WIDTH/4)
 
 
-def draw_polygon_alpha(surface, color, points):
-	# Credit: https://stackoverflow.com/a/64630102
-	lx, ly = zip(*points)
-	min_x, min_y, max_x, max_y = min(lx), min(ly), max(lx), max(ly)
-	target_rect = pygame.Rect(min_x, min_y, max_x - min_x, max_y - min_y)
-	shape_surf = pygame.Surface(target_rect.size, pygame.SRCALPHA)
-	pygame.draw.polygon(shape_surf, color, [(x - min_x, y - min_y) for x, y in points])
-	surface.blit(shape_surf, target_rect)
-
-
 def is_cube_upside_down():
 	if 90<abs(xaxis_rot%360)<270:
 		return True
@@ -245,491 +211,646 @@ def is_cube_backward():
 		return False
 
 
-def text(text, x, y, font, size, alpha=255, bold=False, color=(255,255,255), centered=True):
-	# Draw text center aligned (vertically and horizontally)
-	font = pygame.font.SysFont(font, size, bold=bold)
-	surface = font.render(text, True, color)
-	surface.set_alpha(alpha)
-	text_rect = surface.get_rect(center=(x, y))
+@lru_cache(maxsize=16)
+def get_font(name, size, bold=False):
+	# SysFont lookups are slow, so each font is only loaded once
+	return pygame.font.SysFont(name, size, bold=bold)
+
+
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def render_text(text, font, size, bold, color):
+	# Rendered text surface, shared by every frame that draws the same text
+	return get_font(font, size, bold).render(text, True, color)
+
+
+def text_cache_stats():
+	# Hits and misses of the font and text caches
+	return {"fonts": get_font.cache_info()._asdict(), "text": render_text.cache_info()._asdict()}
+
+
+def text(text, x, y, font, size, alpha=255, bold=False, color=(255,255,255), centered=True, surface=None):
+	# Draw text center aligned (vertically and horizontally) and return its rect
+	if surface is None:
+		surface = screen
+
+	text_surface = render_text(text, font, size, bold, tuple(color))
+	text_surface.set_alpha(alpha)
+	text_rect = text_surface.get_rect(center=(x, y))
 	if centered:
 		text_rect.topleft = (x - text_rect.width // 2, y - text_rect.height // 2)
 	else:
 		text_rect.topleft = (x, y)
-	screen.blit(surface, text_rect)
+	surface.blit(text_surface, text_rect)
+	return text_rect
 	
 
-def rotated_point(x, y, z, xdegrees=0, ydegrees=0, zdegrees=0, center=(150,150,150)):
-	def XROT_MATRIX(degrees):
-		# Returns the rotation matrix for a certain number of degrees around the x axis
-		rads = np.radians(degrees)
-		return np.array([
-			[1, 0, 0],
-			[0, np.cos(rads), -np.sin(rads)],
-			[0, np.sin(rads), np.cos(rads)]
-		])
-
-	def YROT_MATRIX(degrees):
-		# Returns the rotation matrix for a certain number of degrees around the y axis
-		rads = np.radians(degrees)
-		return np.array([
-			[np.cos(rads), 0, np.sin(rads)],
-			[0, 1, 0],
-			[-np.sin(rads), 0, np.cos(rads)]
-		])
-
-	def ZROT_MATRIX(degrees):
-		# Returns the rotation matrix for a certain number of degrees around the z axis
-		rads = np.radians(degrees)
-		return np.array([
-			[np.cos(rads), -np.sin(rads), 0],
-			[np.sin(rads), np.cos(rads), 0],
-			[0, 0, 1]
-		])
-
-	# Returns rotated version with the given rotation angles around a certain center point
-	rotation_matrix = YROT_MATRIX(ydegrees) @ XROT_MATRIX(xdegrees) @  ZROT_MATRIX(zdegrees)
-	rotated = np.array([x-center[0], y-center[1], z-center[2]]) @ rotation_matrix
-	return tuple(list(rotated + np.array([*center])))
+def transform_squares(vertices, matrix, center=(150, 150, 150)):
+	# vertices is an (N, 4, 3) array of squares wound so that (v1 - v0) x (v3 - v0) points outwards
+	# Returns the indices of the squares facing the camera, farthest first (painter's algorithm),
+	# and their on-screen (n, 4, 2) polygons in the same order
+	center = np.asarray(center, dtype=float)
+	rotated = (vertices - center) @ matrix + center
+
+	# Back-face culling: keep squares whose outward normal points towards the camera
+	normals = np.cross(rotated[:, 1] - rotated[:, 0], rotated[:, 3] - rotated[:, 0])
+	to_squares = rotated.mean(axis=1) - CAMERA_POSITION
+	visible = np.nonzero(np.einsum("ij,ij->i", normals, to_squares) < 0)[0]
+	rotated = rotated[visible]
+
+	profiler.lap("transform")
+
+	draw_order = np.argsort(-rotated[..., 2].mean(axis=1), kind="stable")
+	rotated = rotated[draw_order]
+
+	profiler.lap("sort")
+
+	x_real, y_real = real(*get_projection(rotated[..., 0], rotated[..., 1], rotated[..., 2]))
+	projections = np.stack((x_real, y_real), axis=-1)
+
+	return visible[draw_order], projections
+
+
+def project_squares(squares, view):
+	# transform_squares for squares (in geometry units) seen from view, looked up in the projection cache if it's on
+	# Colors don't move squares, so resting squares share entries whatever the state. Frames of a turn (any
+	# other squares) are drawn once each and would only push resting views out, so they skip the cache
+	if projection_cache is None or squares is not SQUARES:
+		return transform_squares(squares * SQUARE_SCALE, rotation_matrix(*view))
+
+	view = projection_cache.quantize(view)
+	key = (GEOMETRY.n, view)
+	projected = projection_cache.get(key)
+	if projected is None:
+		projected = transform_squares(squares * SQUARE_SCALE, rotation_matrix(*view))
+		projection_cache.put(key, projected)
+	return projected
+
+
+def projection_cache_stats():
+	# Hits, misses and memory use of the projection cache, None when it's off
+	return projection_cache.stats() if projection_cache else None
+
+
+def projection_cache_lines():
+	# Profiler overlay lines of the projection cache
+	stats = projection_cache_stats()
+	if stats is None:
+		return []
+	return [f"projection cache {stats['hit_rate']:.0%} hits, {stats['entries']} views, "
+		f"{stats['bytes'] / 2**20:.1f} of {stats['max_bytes'] / 2**20:.0f} MB"]
 
 
 def scramble():
-	global scramble_progress, cube_turn_speed, scrambled, scrambling, solved, mouse_xvel, mouse_yvel
+	global scramble_progress, scramble_length, scramble_done_at, scrambled, scrambling, solved, mouse_xvel, mouse_yvel
 
 	mouse_xvel = 0
 	mouse_yvel = 0
 
-	cube_turn_speed = SCRAMBLE_CUBE_TURN_SPEED
+	# Finish showing any moves still being animated
+	skip_turn_animations()
+
+	scramble_moves = rubiks_cube.scramble(random.randint(*SCRAMBLE_RANGE))
+	if session:
+		session.timer(TIMER_CANCEL)
+		session.moves(scramble_moves)
 
 	scramble_progress = 0
-	times = randint(*SCRAMBLE_RANGE)
+	scramble_length = len(scramble_moves)
 	scrambled = False
+	solved = False
 
 	scrambling = True
-				
-	for i in range(times):
 
-		turn(choice(ALL_MOVES))
-		scramble_progress = round((i+1)/times*100, 1)
-	
-	scrambling = False
-	scrambled = True
-	solved = False	
+	# The scramble is only replayed on screen, the state already has it
+	turn_queue.extend([move, SCRAMBLE_CUBE_TURN_SPEED] for move in scramble_moves)
 
-	scramble_progress = 100
-	cube_turn_speed = NORMAL_CUBE_TURN_SPEED
+	# Scrambling is over once the last scramble move has been shown
+	scramble_done_at = finished_turns + len(turn_queue)
 
+	if not SCRAMBLE_REPLAY:
+		skip_turn_animations()
 
-def closest_face():
-	# Rotate centers
-	rotated_centers = {}
-	for key in SOLVED_CENTERS.keys():
-		rotated_center = []
-		for coords in key:
-			rotated_coords = rotated_point(*coords, xaxis_rot, yaxis_rot, zaxis_rot, center=(150, 150, 150))
-			rotated_center.append(rotated_coords)
-		rotated_center = tuple(rotated_center)
-		rotated_centers[rotated_center]  = SOLVED_CENTERS[key]
 
-	# Find closest face by z value
-	keys = list(rotated_centers.keys())
-	sorted_list = sorted(keys, key=lambda x: sum(coord[2] for coord in x) / len(x))
+@lru_cache(maxsize=1)
+def view_faces(xdegrees, ydegrees, zdegrees):
+	# Which face is at each side of the screen for a view angle, e.g. {"front": "F", "top": "U", ...}
+	# Cached until the view angle changes
+	faces = list(FACE_NORMALS)
+	directions = np.array(list(FACE_NORMALS.values())) @ rotation_matrix(xdegrees, ydegrees, zdegrees)
 
-	return rotated_centers[sorted_list[0]]
-		
+	front = faces[np.argmin(directions[:, 2])]
+	top = faces[np.argmax(directions[:, 1])]
+	left = faces[np.argmin(directions[:, 0])]
 
-def top_face():
-	# Rotate centers
-	rotated_centers = {}
-	for key in SOLVED_CENTERS.keys():
-		rotated_center = []
-		for coords in key:
-			rotated_coords = rotated_point(*coords, xaxis_rot, yaxis_rot, zaxis_rot, center=(150, 150, 150))
-			rotated_center.append(rotated_coords)
-		rotated_center = tuple(rotated_center)
-		rotated_centers[rotated_center]  = SOLVED_CENTERS[key]
+	return {
+		"front": front, "back": OPPOSITE_FACES[front],
+		"top": top, "bottom": OPPOSITE_FACES[top],
+		"left": left, "right": OPPOSITE_FACES[left],
+	}
 
-	# Find top face by y value
-	keys = list(rotated_centers.keys())
-	sorted_list = sorted(keys, key=lambda x: sum(coord[1] for coord in x) / len(x))
 
-	return rotated_centers[sorted_list[-1]]
+def set_cube_size(size):
+	global GEOMETRY, SQUARES, SQUARE_SCALE, rubiks_cube
+	# Switch to a solved size x size x size cube
+	GEOMETRY = cube_geometry(size)
+	SQUARES = GEOMETRY.squares
+	SQUARE_SCALE = 150 / size
 
+	rubiks_cube = Cube(size)
+	skip_turn_animations()
+	redraw_all()
 
-def left_face():
-	# Rotate centers
-	rotated_centers = {}
-	for key in SOLVED_CENTERS.keys():
-		rotated_center = []
-		for coords in key:
-			rotated_coords = rotated_point(*coords, xaxis_rot, yaxis_rot, zaxis_rot, center=(150, 150, 150))
-			rotated_center.append(rotated_coords)
-		rotated_center = tuple(rotated_center)
-		rotated_centers[rotated_center]  = SOLVED_CENTERS[key]
 
-	# Find left face by x value
-	keys = list(rotated_centers.keys())
-	sorted_list = sorted(keys, key=lambda x: sum(coord[0] for coord in x) / len(x))
+def solve_cube():
+	global solve_job
+	# Start solving the current state on a solver thread (the first solve also loads or builds the tables there),
+	# nothing happens on cubes other than 3x3 or while a solve is already running
+	if GEOMETRY.n != 3 or solve_job is not None:
+		return
 
-	return rotated_centers[sorted_list[0]]
+	# Turns replace the state array instead of changing it, so the thread can read it as it is
+	job = {"cube": rubiks_cube, "version": rubiks_cube.version, "state": rubiks_cube.state, "done": False}
 
+	def run_solver():
+		try:
+			job["moves"] = solver.solve(job["state"])
+		except Exception as error:
+			job["error"] = error
+		finally:
+			job["done"] = True
 
-def turn(move):
-	global rubiks_cube
-	# move is U, U', F, F', etc.
-	# to_match = what cubelets to move (and what axis to rotate around)
+	solve_job = job
+	threading.Thread(target=run_solver, daemon=True).start()
 
-	move: str = move # type hinting
-	backwards_rot = False # rotate around axis by negative amount?
 
+def finish_solve():
+	global solve_job
+	# Queues the solution once the solver thread is done, returns whether it did
+	# A solution of a state the cube has since left (turned, scrambled, reset or resized) is dropped
+	if solve_job is None or not solve_job["done"]:
+		return False
 
-	if move.startswith("U"):
-		to_match = ("y", 6)
-		backwards_rot = True
+	job, solve_job = solve_job, None
+	if "error" in job:
+		raise job["error"]
+	if job["cube"] is not rubiks_cube or job["version"] != rubiks_cube.version:
+		return False
 
-	elif move.startswith("D"):
-		to_match = ("y", 0)
+	turn_moves(job["moves"] or [])
+	return True
 
-	elif move.startswith("F"):
-		to_match = ("z", 0)
-		offset_amount = -0.001
 
-	elif move.startswith("B"):
-		to_match = ("z", 6)
-		backwards_rot = True
+def turn(move, speed=None):
+	# move is U, U', F, F', etc.
+	# The move is applied to the state at once, the animation catches up in update_turn_animation
+	rubiks_cube.turn(move)
+	turn_queue.append([move, speed or cube_turn_speed])
+	if session:
+		session.move(move)
+
+
+def turn_moves(moves, speed=None):
+	# moves is a list of moves or a string such as "R U R' U'"
+	# The whole sequence is applied to the state in one step, only the moves left after cancelling and merging
+	# (see cube.compile_moves) are animated
+	moves, permutation = compile_moves(moves, GEOMETRY.n)
+	rubiks_cube.apply_permutation(permutation)
+	turn_queue.extend([move, speed or cube_turn_speed] for move in moves)
+	if session:
+		session.moves(moves)
+
+
+def type_move(move, pressed_at):
+	# A move typed on the keyboard at pressed_at (perf_counter time), shown within MAX_TURN_LAG_FRAMES frames
+	turn(move)
+	turn_number = finished_turns + len(turn_queue) - 1
+	pending_inputs.append((turn_number, pressed_at))
+	typed_deadlines.append((turn_number, animation_frames + MAX_TURN_LAG_FRAMES))
+
+
+def record_input_latency():
+	# Time from each key press to the first frame showing its move, kept by the profiler
+	now = perf_counter()
+	while pending_inputs and (pending_inputs[0][0] < finished_turns or
+		(pending_inputs[0][0] == finished_turns and turn_angle > 0)):
+		profiler.record_latency(now - pending_inputs.popleft()[1])
+
+
+def finish_turn():
+	global displayed_cube, turn_angle, finished_turns
+	# Show the oldest queued move as done
+	displayed_cube = displayed_cube[GEOMETRY.permutation(turn_queue.popleft()[0])]
+	turn_angle = 0
+	finished_turns += 1
+
+
+def turn_speedup():
+	# Smallest speedup of the queued moves that shows every typed move by its deadline
+	while typed_deadlines and typed_deadlines[0][0] < finished_turns:
+		typed_deadlines.popleft()
+	if not typed_deadlines:
+		return 1
+
+	speedup = 1
+	deadlines = iter(typed_deadlines)
+	typed_turn, deadline = next(deadlines)
+	frames = -turn_angle / turn_queue[0][1] # Frames the moves up to this one take at their own speeds
+
+	for turn_number, (move, speed) in enumerate(turn_queue, finished_turns):
+		frames += GEOMETRY.turn_degrees(move) / speed
+		if turn_number == typed_turn:
+			speedup = max(speedup, frames / max(1, deadline - animation_frames + 1))
+			typed_turn, deadline = next(deadlines, (None, None))
+			if typed_turn is None:
+				break
 
-	elif move.startswith("L"):
-		to_match = ("x", 0)
+	return speedup
 
-	elif move.startswith("R"):
-		to_match = ("x", 6)
-		backwards_rot = True
 
-		
-	if "'" in move: # prime
-		backwards_rot = not backwards_rot
-	
-	# Get cubelets to rotate
-	match_index = ["x", "y", "z"].index(to_match[0])
-	
-	# Get center of rotation
-	rotation_center = [3, 3, 3]
-	rotation_center[match_index] = to_match[1]
+def update_turn_animation():
+	global turn_angle, animation_frames
+	# Advance the queued moves by one frame
+	animation_frames += 1
+	if not turn_queue:
+		return
 
-	# Get squares to rotate
-	squares_to_rotate = []
-	for square in rubiks_cube:
+	# Moves are sped up just enough to show every typed move by its deadline. What is left of a frame
+	# after a move finishes goes to the next one, so a long backlog finishes several moves a frame
+	frames = turn_speedup() # Frames of animation at the moves' own speeds to show
 
-		for coord in square:
-			if coord[match_index]==to_match[1]:
-				squares_to_rotate.append(square)
-				break
+	while turn_queue and frames > 0:
+		move, speed = turn_queue[0]
+		frames_left = (GEOMETRY.turn_degrees(move) - turn_angle) / speed
+		if frames >= frames_left - 1e-9:
+			finish_turn()
+			frames -= frames_left
+		else:
+			turn_angle += frames * speed
+			frames = 0
 
-	
-	# Get degrees to rotate by
-	if backwards_rot:
-		rotate_degs = -cube_turn_speed
-	else:
-		rotate_degs = cube_turn_speed
 
-	xrot_degs = 0
-	yrot_degs = 0
-	zrot_degs = 0
+def skip_turn_animations():
+	global displayed_cube, turn_angle, finished_turns
+	# Show the current state right away
+	finished_turns += len(turn_queue)
+	turn_queue.clear()
+	turn_angle = 0
+	displayed_cube = rubiks_cube.state.copy()
 
-	if to_match[0] == "x":
-		xrot_degs = rotate_degs
-	elif to_match[0] == "y":
-		yrot_degs = rotate_degs
-	else:
-		zrot_degs = rotate_degs
 
+def animated_squares(angle=None, move=None):
+	# Square geometry with the layer of move (the move being animated by default) rotated by angle
+	# (turn_angle by default), followed by the interior cross-sections that the turn exposes
+	if move is None:
+		if not turn_queue:
+			return SQUARES
+		move = turn_queue[0][0]
+	if angle is None:
+		angle = turn_angle
+	if angle == 0:
+		return SQUARES
 
-	# Loop rotation and draw
-	times = int(90/cube_turn_speed)
+	layer_squares, matrix, center = GEOMETRY.layer_rotation(move, angle)
+	squares = SQUARES.astype(float)
+	squares[layer_squares] = (SQUARES[layer_squares] - center) @ matrix + center
 
-	pygame.event.set_allowed([pygame.QUIT])
+	rest_interior, layer_interior_squares = GEOMETRY.layer_interior(move)
 
-	for _ in range(times):
-		for index, square in enumerate(squares_to_rotate):
-			rotated_square = []
-			for x, y, z in square:
-				rotated_square.append(rotated_point(x, y, z, xrot_degs, yrot_degs, zrot_degs, rotation_center))
+	return np.concatenate((squares, rest_interior, (layer_interior_squares - center) @ matrix + center))
 
-			rotated_square = tuple(rotated_square)
 
-			rubiks_cube[rotated_square] = rubiks_cube.pop(square)
+def start_screen_overlay():
+	# Returns the alpha of the darkened background and the (text, y offset, size, bold, alpha) of every
+	# start screen text, or None once the start screen has faded out
+	if not started: # Show instructions and title
+		try:
+			instructions_alpha = (pre_start_frames-INSTRUCTIONS_DELAY_SECS*SIMULATION_HZ) / \
+			(INSTRUCTIONS_FADE_SECS*SIMULATION_HZ-INSTRUCTIONS_DELAY_SECS) * 255
+		except ZeroDivisionError:
+			instructions_alpha = 0
 
-			squares_to_rotate[index] = rotated_square
+		instructions_alpha = max(instructions_alpha, 0)
 
-		draw_all(rubiks_cube)
-		
-		if pygame.event.peek(pygame.QUIT):
-			pygame.quit()
-			sys.exit()
+		return 200, (
+			("Virtual Cube", 0, 40, True, 255),
+			("Click and drag to rotate", 40, 20, False, min(instructions_alpha, 255)),
+			("F, B, L, R, U, and D keys to turn", 70, 20, False, 
+				min(instructions_alpha, 255+INSTRUCTION_GAP_FRAMES)-INSTRUCTION_GAP_FRAMES),
+			("Shift to turn counter-clockwise", 100, 20, False, 
+				min(instructions_alpha, 255+INSTRUCTION_GAP_FRAMES*2)-INSTRUCTION_GAP_FRAMES*2),
+		)
+
+	elif post_start_frames < FADE_OUT_SECS*SIMULATION_HZ: # Fade out
+		all_alpha = 255 - (post_start_frames / (FADE_OUT_SECS*SIMULATION_HZ) * 255)
+		all_alpha = max(all_alpha, 0)
+		all_alpha = min(all_alpha, 200)
 
-	pygame.event.set_allowed([pygame.QUIT, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP])
+		return all_alpha, (
+			("Virtual Cube", 0, 40, True, all_alpha),
+			("Click and drag to rotate", 40, 20, False, all_alpha),
+		)
 
-	to_add_keys = []
-	to_remove_keys = []
+	return None
 
-	# Snap rubiks_cube to nearest integer (round coords in keys)
-	for key in rubiks_cube.keys():
-		rounded_key = []
-		for coords in key:
-			rounded_key.append((round(coords[0]), round(coords[1]), round(coords[2])))
 
-		rounded_key = tuple(rounded_key)
-		to_add_keys.append(rounded_key)
-		to_remove_keys.append(key)
-	
-	for add, remove in zip(to_add_keys, to_remove_keys):
-		rubiks_cube[add] = rubiks_cube.pop(remove)
+def hud_texts(overlay, show_fps=SHOW_FPS):
+	# (text, x, y, size, alpha, centered) of the FPS counter and timer, the only things drawn over the scene
+	hud = []
 
+	# --- FPS ------------------------------------------------------------
+	if show_fps and started:
+		fps_alpha = 200-overlay[0] if overlay else 255
+		hud.append((f"FPS: {int(clock.get_fps())}", 20, 20, 18, fps_alpha, False))
 
-def draw_all(cube, cube_opacity=100):
-	global average_dists, rotated_cube, pre_start_frames, post_start_frames
+	# --- TIME ------------------------------------------------------------
+	if scrambled and not solved:
+		if replay_timer is None:
+			time_passed = (pygame.time.get_ticks() - start_time) / 1000
+		else:
+			time_passed = replay_timer
+		minutes = int(time_passed // 60)
+		seconds = time_passed - minutes * 60
+		hud.append((f"{minutes:02}:{seconds:0>5.2f}", SCREEN_WIDTH/2, 40, 30, 255, True))
 
-	# --- RUBIK'S CUBE ------------------------------------------------------------
-	# Rotate the rubiks cube
+	if scrambled and solved:
+		minutes = int(final_time // 60)
+		seconds = final_time - minutes * 60
+		hud.append((f"SOLVED IN {minutes:02}:{seconds:0>5.2f}", SCREEN_WIDTH/2, 40, 30, 255, True))
 
-	rotated_cube = {}
-	for vertices, color in cube.items():
-		temp = []
-		for vertex in vertices:
-			temp.append(tuple(rotated_point(vertex[0]*50, vertex[1]*50, vertex[2]*50, 
-								   xdegrees=xaxis_rot, ydegrees=yaxis_rot, zdegrees=zaxis_rot, center=(150, 150, 150))))
-			
-		rotated_cube[tuple(temp)] = color
+	# --- PROFILER ------------------------------------------------------------
+	if profiler.enabled:
+		for line_number, line in enumerate(profiler.overlay_lines(extra_lines=projection_cache_lines)):
+			hud.append((line, 20, 50 + line_number*16, 12, 255, False))
 
-	# Create list like [(((x, y, z),(x, y, z)), average distance), (((x, y, z),(x, y, z)), average distance), ...] from rotated_cube
-	dists = []
+	return hud
 
 
-	for vertices in rotated_cube.keys():
-		avgz = sum([vertex[2] for vertex in vertices])/4
-		dists.append((vertices, avgz))
-	
+def draw_hud(hud, surface=None):
+	# Returns the rect of every text drawn
+	rects = []
+	for string, x, y, size, alpha, centered in hud:
+		color = COLORS["fps"] if string.startswith("FPS") else COLORS["time"]
+		rects.append(text(string, x, y, font="verdana", size=size, alpha=alpha, color=color, centered=centered,
+			surface=surface))
+
+	profiler.lap("text")
+	return rects
+
 
-	# Sort average_zs by avg z
-	dists.sort(key=lambda x: x[1], reverse=True)
+def draw_cube(surface, cube, squares, view):
+	# Rotate, cull, depth-sort and project every square at once
+	# Squares after the cube's own squares are interior cross-sections shown while a layer turns
+	draw_order, projections = project_squares(squares, view)
 
 	# Draw the rotated cube	
-	screen.fill(COLORS["background"])
-	for vertices, _ in dists:
-		color_to_draw = rotated_cube[vertices]
-		real_projections = []
-		for vertex in vertices:
-			real_projections.append(real(*get_projection(vertex[0], vertex[1], vertex[2])))
-		
-		if cube_opacity == 100:
-			pygame.draw.polygon(screen, color_to_draw, real_projections)
-			pygame.draw.aalines(screen, COLORS["border"], True, real_projections, blend=True)
-		else:
-			draw_polygon_alpha(screen, (*color_to_draw, cube_opacity/100*255), real_projections)
-			alpha_lines(screen, (*COLORS["border"], cube_opacity/100*255), True, real_projections)
+	for index, real_projections in zip(draw_order.tolist(), projections.tolist()):
+		color_to_draw = CUBE_PALETTE[cube[index]] if index < len(cube) else COLORS["interior"]
+		pygame.draw.polygon(surface, color_to_draw, real_projections)
+		pygame.draw.aalines(surface, COLORS["border"], True, real_projections, blend=True)
+
+	profiler.lap("rasterize")
 
 
+def draw_scene(surface, cube, cube_opacity, squares, overlay, view):
+	# Draws everything except the FPS counter and timer, with the cube seen from view (x, y and z rotations)
+
+	global cube_layer, cube_layer_key, overlay_layer
+
+	# --- RUBIK'S CUBE ------------------------------------------------------------
+	surface.fill(COLORS["background"])
+
+	if cube_opacity == 100:
+		draw_cube(surface, cube, squares, view)
+	else:
+		# Fade the whole cube at once: draw it opaque on its own layer (only when it changed) and blend the layer
+		# over the background, instead of blending every square and border separately
+		if cube_layer is None or cube_layer.get_size() != surface.get_size():
+			cube_layer = pygame.Surface(surface.get_size())
+			cube_layer_key = None
+
+		layer_key = (view, cube.tobytes(), squares.tobytes())
+		if layer_key != cube_layer_key:
+			cube_layer.fill(COLORS["background"])
+			draw_cube(cube_layer, cube, squares, view)
+			cube_layer_key = layer_key
+
+		cube_layer.set_alpha(cube_opacity/100*255)
+		surface.blit(cube_layer, (0, 0))
+
 	# --- RESET BUTTON ------------------------------------------------------------
-	pygame.draw.rect(screen, COLORS["button_bg"], reset_button, border_radius=20)
-	text("Reset", reset_button.centerx, reset_button.centery, font="verdana", size=20, color=COLORS["button_fg"])
+	pygame.draw.rect(surface, COLORS["button_bg"], reset_button, border_radius=20)
+	text("Reset", reset_button.centerx, reset_button.centery, font="verdana", size=20, color=COLORS["button_fg"], 
+		surface=surface)
 
 	# --- SCRAMBLE BUTTON ------------------------------------------------------------
-	pygame.draw.rect(screen, COLORS["button_bg"], scramble_button, border_radius=20)
+	pygame.draw.rect(surface, COLORS["button_bg"], scramble_button, border_radius=20)
 	if not scrambling:
-		text("Scramble", scramble_button.centerx, scramble_button.centery, font="verdana", size=20, color=COLORS["button_fg"])
+		text("Scramble", scramble_button.centerx, scramble_button.centery, font="verdana", size=20, 
+			color=COLORS["button_fg"], surface=surface)
 	else:
 		text(f"Scrambling... ({scramble_progress}%)", scramble_button.centerx, scramble_button.centery, font="verdana", 
-			   size=20, color=COLORS["scrambling"])
+			   size=20, color=COLORS["scrambling"], surface=surface)
 
 	# --- START SCREEN ------------------------------------------------------------
-	if not started: # Show instructions and title
-		draw_polygon_alpha(screen, (0,0,0, 200), ((0, 0), (SCREEN_WIDTH, 0), 
-						  (SCREEN_WIDTH, SCREEN_HEIGHT), (0, SCREEN_HEIGHT)))
+	if overlay:
+		background_alpha, overlay_texts = overlay
+
+		if overlay_layer is None:
+			overlay_layer = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+			overlay_layer.fill((0, 0, 0))
+
+		overlay_layer.set_alpha(background_alpha)
+		surface.blit(overlay_layer, (0, 0))
+
+		for string, y_offset, size, bold, alpha in overlay_texts:
+			text(string, SCREEN_WIDTH/2, SCREEN_HEIGHT/2.5+y_offset, font="verdana", size=size, bold=bold, alpha=alpha,
+				surface=surface)
+
+	profiler.lap("rasterize")
+
+
+def draw_all(cube, cube_opacity=100, squares=None, view=None):
+	global scene_layer, last_scene, last_hud, last_hud_rects
+	# Only redraws what changed since the last frame:
+	# the whole scene when the view, cube, buttons or start screen changed, only the texts when just they changed,
+	# and nothing at all when the cube is idle
+	# view is the (x, y, z) rotation to draw the cube at, the current one by default
+	# Returns the seconds since the last frame
+	if squares is None:
+		squares = SQUARES
+	if view is None:
+		view = (xaxis_rot, yaxis_rot, zaxis_rot)
+
+	overlay = start_screen_overlay()
+	hud = hud_texts(overlay)
+
+	scene = (
+		view, cube.tobytes(), None if squares is SQUARES else squares.tobytes(), 
+		cube_opacity, scrambling and scramble_progress, overlay
+	)
+
+	if scene_layer is None or scene_layer.get_size() != screen.get_size():
+		scene_layer = pygame.Surface(screen.get_size())
+		last_scene = None
+
+	if scene != last_scene:
+		draw_scene(scene_layer, cube, cube_opacity, squares, overlay, view)
+		screen.blit(scene_layer, (0, 0))
+		last_hud_rects = draw_hud(hud)
+
+		pygame.display.flip()
+		profiler.lap("flip")
+		render_stats["rendered"] += 1
+
+	elif hud != last_hud:
+		# Put the scene back under the old texts, then draw the new ones
+		for rect in last_hud_rects:
+			screen.blit(scene_layer, rect, rect)
+		dirty_rects = last_hud_rects
+		last_hud_rects = draw_hud(hud)
+
+		pygame.display.update(dirty_rects + last_hud_rects)
+		profiler.lap("flip")
+		render_stats["partial"] += 1
 
-		text("Virtual Cube", SCREEN_WIDTH/2, SCREEN_HEIGHT/2.5, 
-			   font="verdana", size=40, bold=True)
+	else:
+		render_stats["skipped"] += 1
 
-		try:
-			instructions_alpha = (pre_start_frames-INSTRUCTIONS_DELAY_SECS*FPS) / \
-			(INSTRUCTIONS_FADE_SECS*FPS-INSTRUCTIONS_DELAY_SECS) * 255
-		except ZeroDivisionError:
-			instructions_alpha = 0
+	last_scene = scene
+	last_hud = hud
+	
+	frame_ms = clock.tick(render_fps)
+	profiler.end_frame()
+	return frame_ms / 1000
 
-		instructions_alpha = max(instructions_alpha, 0)
 
-		text("Click and drag to rotate", SCREEN_WIDTH/2, SCREEN_HEIGHT/2.5+40,
-			   font="verdana", size=20, alpha=min(instructions_alpha, 255))
-		
-		text("F, B, L, R, U, and D keys to turn", SCREEN_WIDTH/2, SCREEN_HEIGHT/2.5+70,
-			   font="verdana", size=20, alpha=min(instructions_alpha, 255+INSTRUCTION_GAP_FRAMES)-INSTRUCTION_GAP_FRAMES)
-		
-		text("Shift to turn counter-clockwise", SCREEN_WIDTH/2, SCREEN_HEIGHT/2.5+100,
-			   font="verdana", size=20, alpha=min(instructions_alpha, 255+INSTRUCTION_GAP_FRAMES*2)-INSTRUCTION_GAP_FRAMES*2)
-		
-		pre_start_frames += 1
+def render_frame(surface, cube, squares=None, show_fps=SHOW_FPS):
+	# Draws a whole frame on surface, e.g. an offscreen surface, without touching the window or the clock
+	# Returns the HUD texts drawn
+	overlay = start_screen_overlay()
+	hud = hud_texts(overlay, show_fps)
+	draw_scene(surface, cube, cube_opacity, SQUARES if squares is None else squares, overlay,
+		(xaxis_rot, yaxis_rot, zaxis_rot))
+	draw_hud(hud, surface)
+	return hud
 
-	elif post_start_frames < FADE_OUT_SECS*FPS: # Fade out
-		all_alpha = 255 - (post_start_frames / (FADE_OUT_SECS*FPS) * 255)
-		all_alpha = max(all_alpha, 0)
-		all_alpha = min(all_alpha, 200)
 
-		draw_polygon_alpha(screen, (0,0,0, all_alpha), ((0, 0), (SCREEN_WIDTH, 0), 
-						  (SCREEN_WIDTH, SCREEN_HEIGHT), (0, SCREEN_HEIGHT)))
+def redraw_all():
+	global last_scene
+	# Makes the next draw_all redraw everything (e.g. after the window was covered)
+	last_scene = None
 
-		text("Virtual Cube", SCREEN_WIDTH/2, SCREEN_HEIGHT/2.5, 
-			   font="verdana", size=40, bold=True, alpha=all_alpha)
-	
-		text("Click and drag to rotate", SCREEN_WIDTH/2, SCREEN_HEIGHT/2.5+40,
-			   font="verdana", size=20, alpha=all_alpha)
-		
-		# Write FPS
-		
-		if SHOW_FPS:
-			text(f"FPS: {int(clock.get_fps())}", 20, 20, font="verdana", size=18, color=COLORS["fps"], alpha=200-all_alpha, centered=False)
 
-		post_start_frames += 1
+def glide_cube_rot(target_xaxis_rot=0, target_yaxis_rot=0, factor = 0.05):
+	global xaxis_rot, yaxis_rot
+	# Starts gliding the view to the target, covering factor of the way left every simulation step
+	# The glide is the "view" tween, dragging the cube cancels it
+	start_xaxis_rot, start_yaxis_rot = xaxis_rot, yaxis_rot
+	distance = max(abs(xaxis_rot - target_xaxis_rot), abs(yaxis_rot - target_yaxis_rot))
 
-	else:
-		# Write FPS
-		if SHOW_FPS:
-			text(f"FPS: {int(clock.get_fps())}", 20, 20, font="verdana", size=18, color=COLORS["fps"], centered=False)
+	if distance <= 1:
+		tweens.cancel("view")
+		xaxis_rot = target_xaxis_rot
+		yaxis_rot = target_yaxis_rot
+		return
 
-	# --- TIME ------------------------------------------------------------
-	if scrambled and not solved:
-		time_passed = (pygame.time.get_ticks() - start_time) / 1000
-		minutes = int(time_passed // 60)
-		seconds = time_passed - minutes * 60
-		text(f"{minutes:02}:{seconds:0>5.2f}", SCREEN_WIDTH/2, 40, font="verdana", size=30, color=COLORS["time"])
+	# Steps until the view is within a degree of the target, where the glide ends on it
+	steps = ceil(log(1 / distance) / log(1 - factor))
 
-	if scrambled and solved:
-		minutes = int(final_time // 60)
-		seconds = final_time - minutes * 60
-		text(f"SOLVED IN {minutes:02}:{seconds:0>5.2f}", SCREEN_WIDTH/2, 40, font="verdana", size=30, color=COLORS["time"])
+	def update(progress):
+		global xaxis_rot, yaxis_rot
+		covered = (1 - (1-factor) ** (progress * steps)) / (1 - (1-factor) ** steps)
+		xaxis_rot = (start_xaxis_rot + (target_xaxis_rot - start_xaxis_rot) * covered) % 360
+		yaxis_rot = (start_yaxis_rot + (target_yaxis_rot - start_yaxis_rot) * covered) % 360
 
-	# Flip display
-	pygame.display.flip()
-	
-	clock.tick(FPS)
+	tweens.start("view", steps / SIMULATION_HZ, update)
 
 
-def glide_cube_rot(target_xaxis_rot=0, target_yaxis_rot=0, factor = 0.05):
-	global xaxis_rot, yaxis_rot, zaxis_rot
+def set_cube_opacity(opacity):
+	global cube_opacity
+	cube_opacity = opacity
 
-	while abs(xaxis_rot - target_xaxis_rot) > 1 or abs(yaxis_rot - target_yaxis_rot) > 1:
-		xaxis_rot = ((1-factor) * xaxis_rot + factor * target_xaxis_rot) % 360
-		yaxis_rot = ((1-factor) * yaxis_rot + factor * target_yaxis_rot) % 360
 
-		draw_all(rubiks_cube)
-	
-	xaxis_rot = target_xaxis_rot
-	yaxis_rot = target_yaxis_rot
+def reset_cube():
+	global scrambling, solved, start_time, scrambled, mouse_xvel, mouse_yvel, do_glide
+	# Back to a solved cube, stopping any scramble, the timer and the glide waiting for the end of a solve
+	mouse_xvel = 0
+	mouse_yvel = 0
+	rubiks_cube.reset()
+	skip_turn_animations()
+	scrambling = False
+	solved = False
+	start_time = None
+	scrambled = False
+	do_glide = False
+	if session:
+		session.reset()
+
+
+def start_reset():
+	# Starts the reset transition (the "reset" tween, clicking Reset again starts it over):
+	# with RESET_TYPE "FADE" the cube fades out, is reset, and fades back in facing the front after a pause,
+	# with "GLIDE" it is reset at once and the view glides to the front
+	tweens.cancel("view")
+
+	if RESET_TYPE == "FADE":
+		def faded_out():
+			global xaxis_rot, yaxis_rot, zaxis_rot
+			reset_cube()
+			tweens.cancel("view")
+			xaxis_rot = 0
+			yaxis_rot = 0
+			zaxis_rot = 0
+			tweens.start("reset", RESET_PAUSE_SECONDS, on_done=fade_in)
+
+		def fade_in():
+			tweens.start("reset", RESET_FADE_SECONDS, lambda progress: set_cube_opacity(progress * 100))
+
+		start_opacity = cube_opacity
+		tweens.start("reset", RESET_FADE_SECONDS * start_opacity / 100,
+			lambda progress: set_cube_opacity(start_opacity * (1 - progress)), on_done=faded_out)
+	else:
+		reset_cube()
+		glide_cube_rot()
 
 
-def is_cube_solved():
-	red_squares_coords = []
-	orange_squares_coords = []
-	white_squares_coords = []
-	yellow_squares_coords = []
-	green_squares_coords = []
-	blue_squares_coords = []
-
-	for square, color in rubiks_cube.items():
-		if color == COLORS["red"]:
-			red_squares_coords.append(square)
-		elif color == COLORS["orange"]:
-			orange_squares_coords.append(square)
-		elif color == COLORS["white"]:
-			white_squares_coords.append(square)
-		elif color == COLORS["yellow"]:
-			yellow_squares_coords.append(square)
-		elif color == COLORS["green"]:
-			green_squares_coords.append(square)
-		elif color == COLORS["blue"]:
-			blue_squares_coords.append(square)
-	
-	# Check if all zs in red_squares_coords are the same
-	red_zs = set()
-	for square in red_squares_coords:
-		for coords in square:
-			red_zs.add(coords[2])
-	
-	if len(red_zs) != 1:
-		# print("red_zs", red_zs)
-		return False
+def rotate_view(xvel, yvel):
+	global xaxis_rot, yaxis_rot
+	# Spin the view by a mouse movement (xvel is horizontal)
+	xaxis_rot += yvel
+
+	if not is_cube_upside_down():
+		yaxis_rot += xvel
+	else:
+		yaxis_rot -= xvel
+
+	xaxis_rot = xaxis_rot % 360
+	yaxis_rot = yaxis_rot % 360
 
-	# Check if all zs in orange_squares_coords are the same
-	orange_zs = set()
-	for square in red_squares_coords:
-		for coords in square:
-			orange_zs.add(coords[2])
-	
-	if len(orange_zs) != 1:
-		# print("orange_zs", orange_zs)
-		return False
-	
-	# Check if all ys in white_squares_coords are the same
-	white_ys = set()
-	for square in white_squares_coords:
-		for coords in square:
-			white_ys.add(coords[1])
-	
-	if len(white_ys) != 1:
-		# print("white_ys", white_ys)
-		return False
-	
-	# Check if all ys in yellow_squares_coords are the same
-	yellow_ys = set()
-	for square in yellow_squares_coords:
-		for coords in square:
-			yellow_ys.add(coords[1])
-	
-	if len(yellow_ys) != 1:
-		# print("yellow_ys", yellow_ys)
-		return False
-	
-	# Check if all xs in green_squares_coords are the same
-	green_xs = set()
-	for square in green_squares_coords:
-		for coords in square:
-			green_xs.add(coords[0])
-	
-	if len(green_xs) != 1:
-		# print("green_xs", green_xs)
-		return False
-	
-	# Check if all xs in blue_squares_coords are the same
-	blue_xs = set()
-	for square in blue_squares_coords:
-		for coords in square:
-			blue_xs.add(coords[0])
-	
-	if len(blue_xs) != 1:
-		# print("blue_xs", blue_xs)
-		return False
-	
-	return True
 
+def interpolated_view(previous_view, fraction):
+	# View fraction of the way from previous_view to the current one, going the short way around
+	return tuple(
+		(previous + ((current - previous + 180) % 360 - 180) * fraction) % 360
+		for previous, current in zip(previous_view, (xaxis_rot, yaxis_rot, zaxis_rot))
+	)
 
-def alpha_lines(surface, color, closed, points):
-    min_x = min(point[0] for point in points)
-    max_x = max(point[0] for point in points)
-    min_y = min(point[1] for point in points)
-    max_y = max(point[1] for point in points)
-    
-    width = max_x - min_x + 1
-    height = max_y - min_y + 1
-    temp_surface = pygame.Surface((width, height), pygame.SRCALPHA)
-    
-    adjusted_points = [(x - min_x, y - min_y) for x, y in points]
-    
-    pygame.draw.aalines(temp_surface, color, closed, adjusted_points)
 
-    surface.blit(temp_surface, (min_x, min_y))
+def is_cube_solved():
+	return rubiks_cube.is_solved()
+
+
+def start_session():
+	global session
+	# Starts recording this session to a new log in SESSION_DIRECTORY
+	makedirs(SESSION_DIRECTORY, exist_ok=True)
+	session = SessionRecorder(path.join(SESSION_DIRECTORY, strftime("%Y%m%d-%H%M%S") + ".vcl"), GEOMETRY.n,
+		CHECKPOINT_SECS)
+
 
 # --- MAIN -----------------------------------------------------------------------------------------------------
-def main():
-	global screen, rotated_cube, xaxis_rot, yaxis_rot, zaxis_rot, pre_start_frames, post_start_frames, \
-		scrambling, started, rubiks_cube, clock, scrambled, solved, start_time, final_time, \
-		mouse_xvel, mouse_yvel
+def open_window():
+	global screen, clock, render_fps
 
 	pygame.init()
 	clock = pygame.time.Clock()
@@ -737,9 +858,106 @@ def main():
 	pygame.display.set_icon(pygame.image.load(path.dirname(__file__)+"/icon.png"))
 
 	# Next line triggers NSApplicationDelegate's warning for some reason on Mac
-	screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+	if RENDER_MODE == "VSYNC":
+		try:
+			screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SCALED, vsync=1)
+		except pygame.error: # No vsync on this display, frames are still paced at the refresh rate
+			screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
 
-	pygame.event.set_allowed([pygame.QUIT, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP])
+		refresh_rates = getattr(pygame.display, "get_desktop_refresh_rates", lambda: [])()
+		render_fps = refresh_rates[0] if refresh_rates and refresh_rates[0] else DISPLAY_REFRESH_RATE
+	else:
+		screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+		render_fps = FPS
+
+	profiler.budget = 1 / render_fps
+
+	pygame.event.set_allowed([pygame.QUIT, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP, pygame.KEYDOWN,
+		pygame.WINDOWEXPOSED])
+
+
+def prepare_replay(log):
+	global started, post_start_frames, scrambling
+	# Returns a Replay of the SessionLog, with the cube size, start screen and buttons set up to show it
+	set_cube_size(log.n)
+	started = True
+	post_start_frames = FADE_OUT_SECS*SIMULATION_HZ # No start screen
+	scrambling = False
+	return Replay(log)
+
+
+def show_replay(playback):
+	global xaxis_rot, yaxis_rot, zaxis_rot, scrambled, solved, final_time, replay_timer
+	# Sets the globals a frame is drawn from to the Replay's current moment, and returns the state, squares
+	# and turn angle to draw: a move made less than a turn ago (at NORMAL_CUBE_TURN_SPEED) is shown turning
+	# from the state before it. Moves recorded at once (a scramble, a solution) only show the last one turning
+	xaxis_rot, yaxis_rot, zaxis_rot = playback.view
+	replay_timer = playback.timer_seconds()
+	scrambled = replay_timer is not None
+	solved = playback.solve_time is not None
+	final_time = playback.solve_time
+
+	move_seconds = playback.last_move_seconds()
+	if move_seconds is not None:
+		move, _, state_before = playback.last_move
+		angle = move_seconds * NORMAL_CUBE_TURN_SPEED * SIMULATION_HZ
+		if 0 < angle < GEOMETRY.turn_degrees(move):
+			return state_before, animated_squares(angle, move), angle
+
+	return playback.cube.state, SQUARES, 0
+
+
+def replay(log_path, speed=1):
+	# Plays a session log back in the window at speed times real time (MIN_SPEED to MAX_SPEED)
+	# Space pauses, the left and right arrow keys jump REPLAY_SEEK_SECS, the up and down arrow keys double or halve
+	# the speed
+	log = SessionLog(log_path)
+	playback = prepare_replay(log)
+	open_window()
+
+	speed = min(max(speed, MIN_SPEED), MAX_SPEED)
+	paused = False
+	seconds = 0
+	frame_seconds = 0
+
+	running = True
+	while running:
+		for event in pygame.event.get():
+			if event.type == pygame.QUIT:
+				running = False
+			elif event.type == pygame.KEYDOWN:
+				if event.key == pygame.K_SPACE:
+					paused = not paused
+				elif event.key == pygame.K_LEFT:
+					seconds = max(seconds - REPLAY_SEEK_SECS, 0)
+				elif event.key == pygame.K_RIGHT:
+					seconds += REPLAY_SEEK_SECS
+				elif event.key == pygame.K_UP:
+					speed = min(speed * 2, MAX_SPEED)
+				elif event.key == pygame.K_DOWN:
+					speed = max(speed / 2, MIN_SPEED)
+
+		if not paused:
+			seconds += frame_seconds * speed
+		seconds = min(seconds, log.duration)
+		playback.seek(seconds)
+
+		pygame.display.set_caption(f"Virtual Cube - replay {seconds:.1f}/{log.duration:.1f}s at {speed:g}x" +
+			(" (paused)" if paused else ""))
+		state, squares, _ = show_replay(playback)
+		frame_seconds = draw_all(state, squares=squares)
+
+	pygame.quit()
+
+
+def main():
+	global xaxis_rot, yaxis_rot, zaxis_rot, pre_start_frames, post_start_frames, \
+		scrambling, started, scrambled, solved, start_time, final_time, \
+		mouse_xvel, mouse_yvel, scramble_progress, do_glide
+
+	open_window()
+	if RECORD_SESSIONS:
+		start_session()
 
 
 	running = True
@@ -756,8 +974,6 @@ def main():
 	mouse_xvel = 0
 	mouse_yvel = 0
 
-	rotated_cube = rubiks_cube.copy()
-
 	started = False
 	post_start_frames = 0
 	pre_start_frames = 0
@@ -770,191 +986,214 @@ def main():
 	final_time = None
 
 	do_glide = False
+	checked_version = None
+	solve_requested = False
+
+	# Fixed-step simulation: time since the last frame is used up in SIMULATION_STEP steps, and the frame
+	# is drawn between the last two steps' views and turn angles by the fraction of a step left over
+	frame_seconds = 0
+	unsimulated_seconds = 0
+	previous_view = (xaxis_rot, yaxis_rot, zaxis_rot)
+	previous_turn = (finished_turns, turn_angle)
 
 	while running:
 		pygame.display.set_caption(f"Virtual Cube")
 
-		if pygame.event.peek(pygame.QUIT):
-			running = False
-		elif pygame.event.peek(pygame.MOUSEBUTTONDOWN):
-			event = pygame.event.get(pygame.MOUSEBUTTONDOWN)[0]
-			if event.button == 1:
+		clicked_pos = None
+
+		# Handle every event that came in since the last frame
+		for event in pygame.event.get():
+			if event.type == pygame.QUIT:
+				running = False
+
+			elif event.type == pygame.WINDOWEXPOSED:
+				redraw_all()
+
+			elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+				clicked_pos = event.pos
+
 				if not started:
 					started = True
 					mouse_xvel = 0
 
-				if not reset_button.collidepoint(pygame.mouse.get_pos()) and \
-					not scramble_button.collidepoint(pygame.mouse.get_pos()):
-					mouse_dragging = True
-					initial_mouse_pos = pygame.mouse.get_pos()
-				else:
-					mouse_dragging = False
-		elif pygame.event.peek(pygame.MOUSEBUTTONUP):
-			event = pygame.event.get(pygame.MOUSEBUTTONUP)[0]
-			if event.button == 1:
+				mouse_dragging = not reset_button.collidepoint(event.pos) and not scramble_button.collidepoint(event.pos)
+				initial_mouse_pos = event.pos
+				if mouse_dragging:
+					tweens.cancel("view")
+
+			elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
 				mouse_dragging = False
 
-			keys_pressed = pygame.key.get_pressed()
-			keys = [pygame.K_f, pygame.K_b, pygame.K_l, pygame.K_r, pygame.K_u, pygame.K_d]
-			for key in keys:
-				if keys_pressed[key]:
-					if not started:
-						started = True
+			elif event.type == pygame.KEYDOWN:
+				if event.key in KEY_SIDES:
+					started = True
 
-		if started:
-			post_start_frames += 1
+					# Turn the face that was at the key's side of the screen when the key was pressed
+					move = view_faces(xaxis_rot, yaxis_rot, zaxis_rot)[KEY_SIDES[event.key]]
+					if event.mod & pygame.KMOD_SHIFT:
+						move += "'"
+					input_moves.append((move, perf_counter()))
+
+				elif event.key == SOLVE_KEY:
+					solve_requested = True
+
+				elif event.key == PROFILER_KEY:
+					profiler.toggle()
 
+				elif event.key == PROFILER_EXPORT_KEY and profiler.enabled:
+					csv_path, json_path = profiler.export(PROFILER_EXPORT_PATH)
+					print(f"Saved frame profile to {csv_path} and {json_path}")
+
+		if started:
 			if mouse_dragging:
+				# The view follows the mouse every frame, and keeps the drag's speed (per step) when let go
 				current_mouse_pos = pygame.mouse.get_pos()
-				mouse_xvel = (current_mouse_pos[0] - initial_mouse_pos[0]) * 0.4
-				mouse_yvel = (current_mouse_pos[1] - initial_mouse_pos[1]) * 0.4
+				drag_x = (current_mouse_pos[0] - initial_mouse_pos[0]) * 0.4
+				drag_y = (current_mouse_pos[1] - initial_mouse_pos[1]) * 0.4
 				initial_mouse_pos = current_mouse_pos
-			else:
-				if abs(mouse_xvel) > 0.005 or abs(mouse_yvel) > 0.005:
-					mouse_xvel *= SPIN_FACTOR
-					mouse_yvel *= SPIN_FACTOR
-				else:
+
+				rotate_view(drag_x, drag_y)
+				previous_view = (xaxis_rot, yaxis_rot, zaxis_rot)
+
+				step_share = SIMULATION_STEP / frame_seconds if frame_seconds else 1
+				mouse_xvel = drag_x * step_share
+				mouse_yvel = drag_y * step_share
+
+			# Typed moves are turned at once (they are shown one after another),
+			# moves typed during a scramble wait until it is over
+			if not scrambling:
+				while input_moves:
+					type_move(*input_moves.popleft())
 					mouse_xvel = 0
 					mouse_yvel = 0
 
-			keys_pressed = pygame.key.get_pressed()
-
-			move = None
-
-			if keys_pressed[pygame.K_f]:
-				closest = closest_face()
-				if closest == COLORS["red"]:		move = "F"
-				elif closest == COLORS["white"]:	move = "U"
-				elif closest == COLORS["blue"]:		move = "R"
-				elif closest == COLORS["green"]:	move = "L"
-				elif closest == COLORS["yellow"]:	move = "D"
-				elif closest == COLORS["orange"]:	move = "B"
-
-			elif keys_pressed[pygame.K_b]:
-				closest = closest_face()
-				if closest == COLORS["red"]:		move = "B"
-				elif closest == COLORS["white"]:	move = "D"
-				elif closest == COLORS["blue"]:		move = "L"
-				elif closest == COLORS["green"]:	move = "R"
-				elif closest == COLORS["yellow"]:	move = "U"
-				elif closest == COLORS["orange"]:	move = "F"
-
-			elif keys_pressed[pygame.K_u]:
-				top = top_face()
-				if top == COLORS["white"]:			move = "U"
-				elif top == COLORS["blue"]:			move = "R"
-				elif top == COLORS["green"]:		move = "L"
-				elif top == COLORS["yellow"]:		move = "D"
-				elif top == COLORS["orange"]:		move = "B"
-				elif top == COLORS["red"]:			move = "F"
-
-			elif keys_pressed[pygame.K_d]:
-				top = top_face()
-				if top == COLORS["white"]:			move = "D"
-				elif top == COLORS["blue"]:			move = "L"
-				elif top == COLORS["green"]:		move = "R"
-				elif top == COLORS["yellow"]:		move = "U"
-				elif top == COLORS["orange"]:		move = "F"
-				elif top == COLORS["red"]:			move = "B"
-
-			elif keys_pressed[pygame.K_l]:
-				left = left_face()
-				if left == COLORS["green"]:			move = "L"
-				elif left == COLORS["white"]:		move = "U"
-				elif left == COLORS["yellow"]:		move = "D"
-				elif left == COLORS["blue"]:		move = "R"
-				elif left == COLORS["orange"]:		move = "B"
-				elif left == COLORS["red"]:			move = "F"
-			
-			elif keys_pressed[pygame.K_r]:
-				left = left_face()
-				if left == COLORS["green"]:			move = "R"
-				elif left == COLORS["white"]:		move = "D"
-				elif left == COLORS["yellow"]:		move = "U"
-				elif left == COLORS["blue"]:		move = "L"
-				elif left == COLORS["orange"]:		move = "F"
-				elif left == COLORS["red"]:			move = "B"
-				
-			if move:
-				if keys_pressed[pygame.K_LSHIFT] or keys_pressed[pygame.K_RSHIFT]:
-					if "'" in move:
-						move = move[:-1]
+				if solve_requested:
+					solve_cube()
+					solve_requested = False
+
+			if finish_solve():
+				scrambled = False # Solutions shown by the solver aren't timed
+				if session:
+					session.timer(TIMER_CANCEL)
+
+		profiler.lap("events")
+
+		# --- SIMULATION ----------------------------------------------------------------------------------------------
+		unsimulated_seconds += frame_seconds
+		steps = 0
+		while unsimulated_seconds >= SIMULATION_STEP:
+			if steps == MAX_SIMULATION_STEPS:
+				unsimulated_seconds = 0
+				break
+
+			previous_view = (xaxis_rot, yaxis_rot, zaxis_rot)
+			previous_turn = (finished_turns, turn_angle)
+
+			if started:
+				post_start_frames += 1
+
+				if not mouse_dragging:
+					if abs(mouse_xvel) > 0.005 or abs(mouse_yvel) > 0.005:
+						mouse_xvel *= SPIN_FACTOR
+						mouse_yvel *= SPIN_FACTOR
 					else:
-						move += "'"
+						mouse_xvel = 0
+						mouse_yvel = 0
+					rotate_view(mouse_xvel, mouse_yvel)
+			else:
+				pre_start_frames += 1
+				mouse_xvel = -9/SIMULATION_HZ
+				rotate_view(mouse_xvel, mouse_yvel)
+
+			update_turn_animation()
+			tweens.step(SIMULATION_STEP)
+
+			unsimulated_seconds -= SIMULATION_STEP
+			steps += 1
+
+		if session:
+			session.view((xaxis_rot, yaxis_rot, zaxis_rot))
+			if session.checkpoint_due():
+				session.checkpoint(rubiks_cube.state, (xaxis_rot, yaxis_rot, zaxis_rot))
+
+		fraction = unsimulated_seconds / SIMULATION_STEP
+		view = interpolated_view(previous_view, fraction)
 
-				turn(move)
-				mouse_xvel = 0
-				mouse_yvel = 0
-					
+		# The turn angle is only blended within one move, a move that just started turns from 0
+		previous_turns, previous_angle = previous_turn
+		if previous_turns == finished_turns:
+			angle = previous_angle + (turn_angle - previous_angle) * fraction
 		else:
-			pre_start_frames += 1
-			mouse_xvel = -9/FPS
+			angle = turn_angle * fraction
+		squares = animated_squares(angle)
+		profiler.lap("update")
 
-		draw_all(rubiks_cube)
+		frame_seconds = draw_all(displayed_cube, cube_opacity, squares, view)
+		record_input_latency()
 		
-		if reset_button.collidepoint(pygame.mouse.get_pos()):
-			if pygame.mouse.get_pressed()[0] and not mouse_dragging:
-
-				if RESET_TYPE == "FADE":
-					for alpha in reversed(np.linspace(0, 100, RESET_FADE_FRAMES)):
-						draw_all(rubiks_cube, int(alpha))
-					sleep(RESET_PAUSE_SECONDS)
-				
-				mouse_xvel = 0
-				mouse_yvel = 0
-				rubiks_cube = SOLVED_CUBE.copy()
-				solved = False
-				start_time = None
-				scrambled = False
-
-				if RESET_TYPE == "FADE":
-					xaxis_rot = 0
-					yaxis_rot = 0
-					zaxis_rot = 0
-
-					for alpha in np.linspace(0, 100, RESET_FADE_FRAMES):
-						draw_all(rubiks_cube, alpha)
-				else:
-					glide_cube_rot()
-
-
-		if scramble_button.collidepoint(pygame.mouse.get_pos()):
-			if pygame.mouse.get_pressed()[0] and not mouse_dragging and not scrambling:
-				if not started:
-					started = True
+		if clicked_pos and reset_button.collidepoint(clicked_pos):
+			start_reset()
+
+
+		if clicked_pos and scramble_button.collidepoint(clicked_pos):
+			if not started:
+				started = True
+
+			if scrambling:
+				# Skip to the end of the scramble replay
+				skip_turn_animations()
+			else:
 				scramble()
+		
+		# --- SCRAMBLE ------------------------------------------------------------------------------------------------
+		if scrambling:
+			scramble_progress = round(100 - (scramble_done_at - finished_turns) / scramble_length * 100, 1)
+
+			if finished_turns >= scramble_done_at:
+				scrambling = False
+				scrambled = True
 				start_time = pygame.time.get_ticks()
+				if session:
+					session.timer(TIMER_START)
+				checked_version = None
 		
 		# --- TIMER ---------------------------------------------------------------------------------------------------
-		# Timer starts when cube is scrambled and ends when solved
-		if scrambled and not solved:
+		# Timer starts when cube is scrambled and ends when solved (only checked after the cube changes)
+		if scrambled and not solved and rubiks_cube.version != checked_version:
+			checked_version = rubiks_cube.version
+
 			if is_cube_solved():
 				final_time = (pygame.time.get_ticks() - start_time) / 1000
+				if session:
+					session.timer(TIMER_STOP, final_time)
 				do_glide = True
 				solved = True
 
-		if do_glide:
-			# Glide to target (it looks cool)
+		if do_glide and not turn_queue:
+			# Glide to target once the last move has been shown (it looks cool)
 			glide_cube_rot(20, 325)
 
 			do_glide = False
 
-		# --- ROTATION -------------------------------------------------------------------------------------------------
-		xaxis_rot += mouse_yvel
-
-		if not is_cube_upside_down():
-			yaxis_rot += mouse_xvel
-		else:
-			yaxis_rot -= mouse_xvel
-
-		# 25 -330
+		profiler.lap("update")
 
-		xaxis_rot = xaxis_rot % 360
-		yaxis_rot = yaxis_rot % 360
-		zaxis_rot = zaxis_rot % 360
+	if session:
+		session.close()
 
 	pygame.quit()
 	quit()
 
 if __name__ == "__main__":
-	main()
+	parser = argparse.ArgumentParser(description="Virtual Cube")
+	parser.add_argument("--replay", metavar="LOG", help="watch a recorded session (.vcl) instead of playing")
+	parser.add_argument("--speed", type=float, default=1, help=f"replay speed, {MIN_SPEED} to {MAX_SPEED} times")
+	parser.add_argument("--headless", action="store_true", help="replay without a window, as fast as possible, "
+		"and print a summary")
+	args = parser.parse_args()
+
+	if args.replay and args.headless:
+		print_summary(SessionLog(args.replay))
+	elif args.replay:
+		replay(args.replay, args.speed)
+	else:
+		main()
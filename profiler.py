@@ -0,0 +1,153 @@
+#
+#    profiler.py
+#
+#   Frame-time profiler: splits every frame into phases, keeps rolling percentiles and counts dropped frames
+#
+#   Code marks the end of each phase with lap(phase), and end_frame() closes the frame (time since the last lap
+#   counts as "idle", which is mostly clock.tick waiting for the next frame)
+#   Everything returns at once while the profiler is off, so the calls can stay in the frame loop
+#   record_latency(seconds) keeps input latencies (key press to the first frame showing its move) alongside
+#
+
+
+# --- IMPORTS -------------------------------------------------------------------------------------------------
+from collections import deque
+import csv
+import json
+from time import perf_counter
+
+import numpy as np
+
+
+# --- CONSTANTS ------------------------------------------------------------------------------------------------
+PHASES = ["events", "update", "transform", "sort", "rasterize", "text", "flip", "idle"]
+PHASE_INDEX = {phase: index for index, phase in enumerate(PHASES)}
+PERCENTILES = [50, 95, 99]
+DROP_TOLERANCE = 1.5 # Frames taking longer than this many frame budgets count as dropped
+
+
+# --- PROFILER -------------------------------------------------------------------------------------------------
+class FrameProfiler:
+	# Keeps the phase times of the last window frames, in seconds
+
+	def __init__(self, target_fps, window=600):
+		self.enabled = False
+		self.budget = 1 / target_fps
+		self.window = window
+		self.reset()
+
+	def reset(self):
+		self.frames = deque(maxlen=self.window) # One row of PHASES times per frame, plus the whole frame's time
+		self.frame_count = 0
+		self.dropped = 0
+		self.current = [0.0] * len(PHASES)
+		self.frame_start = self.last_lap = perf_counter()
+		self.latencies = deque(maxlen=self.window) # Last window input latencies, in seconds
+
+		self.lines = None # Last overlay_lines, and the frame they were made on
+		self.lines_frame = 0
+
+	def toggle(self):
+		self.enabled = not self.enabled
+		if self.enabled:
+			self.reset()
+
+	def lap(self, phase):
+		# Time since the last lap goes to phase
+		if not self.enabled:
+			return
+		now = perf_counter()
+		self.current[PHASE_INDEX[phase]] += now - self.last_lap
+		self.last_lap = now
+
+	def record_latency(self, seconds):
+		if self.enabled:
+			self.latencies.append(seconds)
+
+	def end_frame(self):
+		if not self.enabled:
+			return
+		now = perf_counter()
+		self.current[PHASE_INDEX["idle"]] += now - self.last_lap
+
+		frame_time = now - self.frame_start
+		self.frames.append(self.current + [frame_time])
+		self.frame_count += 1
+		if frame_time > self.budget * DROP_TOLERANCE:
+			self.dropped += 1
+
+		self.current = [0.0] * len(PHASES)
+		self.frame_start = self.last_lap = now
+
+	def summary(self):
+		# {"frames", "dropped", "target_ms", "phases": {phase or "busy" or "frame": {"mean", "p50", "p95", "p99"}},
+		# "input_latency": {"count", "mean", "p50", "p95", "p99"}} in milliseconds, busy being the whole frame except
+		# idle, over the last window frames (and input latencies)
+		summary = {"frames": self.frame_count, "dropped": self.dropped, "target_ms": self.budget * 1000, "phases": {},
+			"input_latency": {"count": len(self.latencies)}}
+
+		if self.latencies:
+			latencies = np.array(self.latencies) * 1000
+			summary["input_latency"]["mean"] = float(latencies.mean())
+			summary["input_latency"].update(
+				{f"p{p}": float(value) for p, value in zip(PERCENTILES, np.percentile(latencies, PERCENTILES))})
+
+		if not self.frames:
+			return summary
+
+		times = np.array(self.frames) * 1000
+		columns = {phase: times[:, index] for index, phase in enumerate(PHASES)}
+		columns["busy"] = times[:, -1] - times[:, PHASE_INDEX["idle"]]
+		columns["frame"] = times[:, -1]
+
+		for name, column in columns.items():
+			percentiles = np.percentile(column, PERCENTILES)
+			summary["phases"][name] = {"mean": float(column.mean())}
+			summary["phases"][name].update({f"p{p}": float(value) for p, value in zip(PERCENTILES, percentiles)})
+
+		return summary
+
+	def overlay_lines(self, refresh_frames=30, extra_lines=None):
+		# Short text lines for an on-screen overlay, only remade every refresh_frames frames so they can be read
+		# (and aren't rendered again every frame), followed by those of extra_lines() if given
+		if self.lines is not None and 0 <= self.frame_count - self.lines_frame < refresh_frames:
+			return self.lines
+
+		summary = self.summary()
+		self.lines_frame = self.frame_count
+		if not summary["phases"]:
+			self.lines = ["Profiling..."] + (extra_lines() if extra_lines else [])
+			return self.lines
+
+		phases = summary["phases"]
+		busy = phases["busy"]
+		self.lines = [
+			f"busy p50 {busy['p50']:.2f}  p95 {busy['p95']:.2f}  p99 {busy['p99']:.2f} ms",
+			f"dropped {summary['dropped']} of {summary['frames']} frames ({summary['target_ms']:.1f} ms target)",
+		]
+		for phase in PHASES[:-1]:
+			self.lines.append(f"{phase} p50 {phases[phase]['p50']:.2f}  p95 {phases[phase]['p95']:.2f} ms")
+
+		latency = summary["input_latency"]
+		if latency["count"]:
+			self.lines.append(f"input latency p50 {latency['p50']:.1f}  p95 {latency['p95']:.1f} ms ({latency['count']} moves)")
+
+		if extra_lines:
+			self.lines += extra_lines()
+		return self.lines
+
+	def export(self, path):
+		# Writes every kept frame to path + ".csv" and the summary to path + ".json", returns both paths
+		csv_path, json_path = path + ".csv", path + ".json"
+
+		with open(csv_path, "w", newline="") as file:
+			writer = csv.writer(file)
+			writer.writerow(["frame"] + [phase + "_ms" for phase in PHASES] + ["frame_ms"])
+			first_frame = self.frame_count - len(self.frames)
+			for index, times in enumerate(self.frames):
+				writer.writerow([first_frame + index] + [round(time * 1000, 4) for time in times])
+
+		with open(json_path, "w") as file:
+			json.dump(self.summary(), file, indent=2)
+
+		return csv_path, json_path
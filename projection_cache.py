@@ -0,0 +1,72 @@
+#
+#    projection_cache.py
+#
+#   LRU cache of projected squares: the draw order and on-screen polygons of a view, so views that come back
+#   (the start screen's spin, the glide after a solve, resets to the front) are looked up instead of computed
+#
+#   Keys hold the view angles rounded to multiples of step degrees (the view is drawn at the rounded angles so
+#   a cached entry is exact). Entries are evicted, least recently used first, once they take more than max_bytes
+#
+
+
+# --- IMPORTS -------------------------------------------------------------------------------------------------
+from collections import OrderedDict
+import sys
+
+
+# --- CACHE ----------------------------------------------------------------------------------------------------
+class ProjectionCache:
+
+	def __init__(self, max_bytes, step=0.25):
+		self.max_bytes = max_bytes
+		self.step = step
+		self.entries = OrderedDict() # key: (value, bytes), least recently used first
+		self.bytes = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def quantize(self, view):
+		# View angles rounded to the cache's step, in [0, 360)
+		return tuple(round(angle / self.step) * self.step % 360 for angle in view)
+
+	def get(self, key):
+		entry = self.entries.get(key)
+		if entry is None:
+			self.misses += 1
+			return None
+
+		self.hits += 1
+		self.entries.move_to_end(key)
+		return entry[0]
+
+	def put(self, key, arrays):
+		# arrays is a tuple of numpy arrays, counted by their size plus the key's
+		size = sum(array.nbytes for array in arrays) + sum(sys.getsizeof(part) for part in key)
+		if size > self.max_bytes:
+			return
+
+		if key in self.entries:
+			self.bytes -= self.entries.pop(key)[1]
+		self.entries[key] = (arrays, size)
+		self.bytes += size
+
+		while self.bytes > self.max_bytes:
+			self.bytes -= self.entries.popitem(last=False)[1][1]
+			self.evictions += 1
+
+	def clear(self):
+		self.entries.clear()
+		self.bytes = 0
+
+	def stats(self):
+		lookups = self.hits + self.misses
+		return {
+			"entries": len(self.entries),
+			"bytes": self.bytes,
+			"max_bytes": self.max_bytes,
+			"hits": self.hits,
+			"misses": self.misses,
+			"evictions": self.evictions,
+			"hit_rate": self.hits / lookups if lookups else 0.0,
+		}
@@ -0,0 +1,300 @@
+#
+#    session.py
+#
+#   Session logs: every move, view change and timer event of a session in a compact binary file, for replays
+#
+#   Usage: python session.py sessions/20240701-120000.vcl [--at SECONDS]
+#   (replays the whole log headless, as fast as it goes, and prints a summary; see main.py --replay to watch one)
+#
+#   The file is a HEADER followed by records: RECORD (milliseconds since the session started, kind, payload size)
+#   and the payload. The recorder keeps records in memory and writes them FLUSH_BYTES at a time
+#   Every CHECKPOINT_SECS a checkpoint record holds the whole state, so any moment of a replay is rebuilt from the
+#   checkpoint before it instead of from the start
+#
+
+
+# --- IMPORTS -------------------------------------------------------------------------------------------------
+from bisect import bisect_right
+import argparse
+import math
+import struct
+import time
+
+import numpy as np
+
+from cube import Cube
+
+
+# --- CONSTANTS ------------------------------------------------------------------------------------------------
+MAGIC = b"VCUBELOG"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sHBd") # magic, format version, cube size, start time (Unix seconds)
+RECORD = struct.Struct("<IBH") # milliseconds since the start, kind, payload size
+
+# Record kinds
+MOVE = 1 # payload: the move in ASCII
+VIEW = 2 # payload: VIEW_PAYLOAD
+TIMER = 3 # payload: TIMER_PAYLOAD
+RESET = 4 # back to a solved cube, with no timer
+CHECKPOINT = 5 # payload: CHECKPOINT_PAYLOAD and the state, one byte per square
+
+# Timer events
+TIMER_START = 0 # Scrambled, the solve starts
+TIMER_STOP = 1 # Solved, seconds is the solve time
+TIMER_CANCEL = 2 # Timer hidden without a solve (new scramble or solver)
+
+VIEW_PAYLOAD = struct.Struct("<3H") # x, y and z rotation in ANGLE_UNITS
+TIMER_PAYLOAD = struct.Struct("<Bf") # timer event, seconds
+CHECKPOINT_PAYLOAD = struct.Struct("<3HIf") # view, timer start (ms, NO_TIME if none), solve time (NaN if none)
+
+ANGLE_UNITS = 65536 / 360 # Angles are stored in 1/65536ths of a turn
+NO_TIME = 0xFFFFFFFF
+FLUSH_BYTES = 64 * 1024
+CHECKPOINT_SECS = 5
+MIN_SPEED = 1
+MAX_SPEED = 100
+
+
+# --- FUNCTIONS -----------------------------------------------------------------------------------------------
+def pack_view(view):
+	return tuple(round(angle * ANGLE_UNITS) % 65536 for angle in view)
+
+
+def unpack_view(packed):
+	return tuple(angle / ANGLE_UNITS for angle in packed)
+
+
+# --- RECORDING ------------------------------------------------------------------------------------------------
+class SessionRecorder:
+	# Writes a session log to path as it happens
+
+	def __init__(self, path, n, checkpoint_secs=CHECKPOINT_SECS):
+		self.file = open(path, "wb")
+		self.buffer = bytearray(HEADER.pack(MAGIC, FORMAT_VERSION, n, time.time()))
+		self.start = time.perf_counter()
+		self.checkpoint_secs = checkpoint_secs
+		self.next_checkpoint = 0
+
+		self.last_view = None
+		self.timer_start = NO_TIME
+		self.solve_time = math.nan
+
+	def now(self):
+		return int((time.perf_counter() - self.start) * 1000)
+
+	def write(self, kind, payload=b""):
+		self.buffer += RECORD.pack(self.now(), kind, len(payload))
+		self.buffer += payload
+		if len(self.buffer) >= FLUSH_BYTES:
+			self.flush()
+
+	def flush(self):
+		self.file.write(self.buffer)
+		self.buffer.clear()
+
+	def close(self):
+		self.flush()
+		self.file.close()
+
+	def move(self, move):
+		self.write(MOVE, move.encode("ascii"))
+
+	def moves(self, moves):
+		for move in moves:
+			self.move(move)
+
+	def view(self, view):
+		# Only written when the stored angles change
+		packed = pack_view(view)
+		if packed != self.last_view:
+			self.last_view = packed
+			self.write(VIEW, VIEW_PAYLOAD.pack(*packed))
+
+	def timer(self, event, seconds=0.0):
+		if event == TIMER_START:
+			self.timer_start, self.solve_time = self.now(), math.nan
+		elif event == TIMER_STOP:
+			self.solve_time = seconds
+		else:
+			self.timer_start, self.solve_time = NO_TIME, math.nan
+		self.write(TIMER, TIMER_PAYLOAD.pack(event, seconds))
+
+	def reset(self):
+		self.timer_start, self.solve_time = NO_TIME, math.nan
+		self.write(RESET)
+
+	def checkpoint_due(self):
+		return time.perf_counter() - self.start >= self.next_checkpoint
+
+	def checkpoint(self, state, view):
+		self.next_checkpoint += self.checkpoint_secs
+		self.last_view = pack_view(view)
+		self.write(CHECKPOINT, CHECKPOINT_PAYLOAD.pack(*self.last_view, self.timer_start, self.solve_time) +
+			np.asarray(state, dtype=np.uint8).tobytes())
+
+
+# --- REPLAY -------------------------------------------------------------------------------------------------
+class SessionLog:
+	# A recorded session, read once and indexed: times (ms), kinds and payload offsets of every record
+	# A log cut short (e.g. the app was killed) is read up to its last whole record
+
+	def __init__(self, path):
+		with open(path, "rb") as file:
+			self.data = file.read()
+
+		if len(self.data) < HEADER.size:
+			raise ValueError(f"{path} is not a session log")
+		magic, version, self.n, self.started = HEADER.unpack_from(self.data)
+		if magic != MAGIC or version != FORMAT_VERSION:
+			raise ValueError(f"{path} is not a session log of format version {FORMAT_VERSION}")
+
+		self.times, self.kinds, self.offsets, self.sizes = [], [], [], []
+		offset = HEADER.size
+		while offset + RECORD.size <= len(self.data):
+			milliseconds, kind, size = RECORD.unpack_from(self.data, offset)
+			offset += RECORD.size
+			if offset + size > len(self.data):
+				break
+			self.times.append(milliseconds)
+			self.kinds.append(kind)
+			self.offsets.append(offset)
+			self.sizes.append(size)
+			offset += size
+
+		self.checkpoints = [index for index, kind in enumerate(self.kinds) if kind == CHECKPOINT]
+		self.checkpoint_times = [self.times[index] for index in self.checkpoints]
+		self.duration = self.times[-1] / 1000 if self.times else 0
+
+	def payload(self, index):
+		return self.data[self.offsets[index]:self.offsets[index] + self.sizes[index]]
+
+
+class Replay:
+	# The session at any moment of a log: cube, view and timer, moved forward record by record,
+	# or rebuilt from the checkpoint before the moment when seeking back or far ahead
+	# The last move is kept with the state before it, so it can be shown turning (see last_move_seconds)
+
+	def __init__(self, log):
+		self.log = log
+		self.rewind()
+
+	def rewind(self):
+		self.cube = Cube(self.log.n)
+		self.view = (0, 0, 0)
+		self.timer_start = None # Seconds into the session
+		self.solve_time = None
+		self.index = 0 # Next record to apply
+		self.time = 0
+		self.last_move = None # (move, seconds into the session, state before the move) of the last move applied
+
+	def apply(self, index):
+		kind, payload = self.log.kinds[index], self.log.payload(index)
+
+		if kind == MOVE:
+			move = payload.decode("ascii")
+			self.last_move = (move, self.log.times[index] / 1000, self.cube.state)
+			self.cube.turn(move)
+		elif kind == VIEW:
+			self.view = unpack_view(VIEW_PAYLOAD.unpack(payload))
+		elif kind == TIMER:
+			event, seconds = TIMER_PAYLOAD.unpack(payload)
+			if event == TIMER_START:
+				self.timer_start, self.solve_time = self.log.times[index] / 1000, None
+			elif event == TIMER_STOP:
+				self.solve_time = seconds
+			else:
+				self.timer_start = self.solve_time = None
+		elif kind == RESET:
+			self.cube.reset()
+			self.timer_start = self.solve_time = None
+			self.last_move = None
+		elif kind == CHECKPOINT:
+			*view, timer_start, solve_time = CHECKPOINT_PAYLOAD.unpack_from(payload)
+			self.view = unpack_view(view)
+			self.timer_start = None if timer_start == NO_TIME else timer_start / 1000
+			self.solve_time = None if math.isnan(solve_time) else solve_time
+			self.cube.state = np.frombuffer(payload, np.uint8, offset=CHECKPOINT_PAYLOAD.size)
+
+	def seek(self, seconds):
+		# Moves the replay to seconds into the session
+		milliseconds = seconds * 1000
+		checkpoint = bisect_right(self.log.checkpoint_times, milliseconds) - 1
+
+		if milliseconds < self.time * 1000 or (checkpoint >= 0 and self.log.checkpoints[checkpoint] > self.index):
+			self.rewind()
+			if checkpoint >= 0:
+				self.index = self.log.checkpoints[checkpoint]
+
+		times = self.log.times
+		while self.index < len(times) and times[self.index] <= milliseconds:
+			self.apply(self.index)
+			self.index += 1
+		self.time = seconds
+
+	def last_move_seconds(self):
+		# Seconds between the last move and the replay's time, None if there hasn't been one since the last reset
+		# (or since the checkpoint a seek started from)
+		if self.last_move is None:
+			return None
+		return self.time - self.last_move[1]
+
+	def timer_seconds(self):
+		# Seconds shown by the timer at the replay's time, None when it isn't shown
+		if self.solve_time is not None:
+			return self.solve_time
+		if self.timer_start is not None:
+			return self.time - self.timer_start
+		return None
+
+
+def replay_headless(log):
+	# Replays the whole log as fast as it goes, returns a summary
+	replay = Replay(log)
+	solve_times = []
+	start = time.perf_counter()
+
+	for index, kind in enumerate(log.kinds):
+		replay.apply(index)
+		if kind == TIMER and replay.solve_time is not None:
+			solve_times.append(replay.solve_time)
+	replay.index, replay.time = len(log.kinds), log.duration
+
+	seconds = time.perf_counter() - start
+	return {
+		"duration": log.duration,
+		"records": len(log.kinds),
+		"moves": log.kinds.count(MOVE),
+		"checkpoints": len(log.checkpoints),
+		"solve_times": solve_times,
+		"solved_at_end": bool(replay.cube.is_solved()),
+		"speed": log.duration / seconds if seconds else math.inf, # Times faster than the session
+	}
+
+
+def print_summary(log, at=None):
+	# Replays the log headless and prints its summary, and the session at seconds in
+	summary = replay_headless(log)
+	print(f"{summary['duration']:.1f}s session, {summary['records']} records, {summary['moves']} moves, "
+		f"{summary['checkpoints']} checkpoints, replayed {summary['speed']:.0f}x faster than real time")
+	print("Solve times: " + (", ".join(f"{seconds:.2f}s" for seconds in summary["solve_times"]) or "none"))
+	print(f"Solved at the end: {summary['solved_at_end']}")
+
+	if at is not None:
+		replay = Replay(log)
+		replay.seek(at)
+		timer = replay.timer_seconds()
+		print(f"At {at:.1f}s: solved {replay.cube.is_solved()}, view {tuple(round(a, 1) for a in replay.view)}, "
+			f"timer {'-' if timer is None else f'{timer:.2f}s'}")
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Replay a session log headless and summarize it")
+	parser.add_argument("log", help="session log (.vcl) to replay")
+	parser.add_argument("--at", type=float, default=None, help="also show the session at this many seconds in")
+	args = parser.parse_args()
+
+	print_summary(SessionLog(args.log), args.at)
+
+
+if __name__ == "__main__":
+	main()
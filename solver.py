@@ -0,0 +1,469 @@
+#
+#    solver.py
+#
+#   Two-phase solver (Kociemba's algorithm) for the 3x3 cube states used by cube.py
+#
+#   Phase 1 brings the cube into the group <U, D, R2, L2, F2, B2> (no twisted corners, no flipped edges, and the
+#   E-slice edges in the E slice), phase 2 solves it using only those moves. Both phases are IDA* searches over
+#   coordinates (small integers describing part of the cube) with move and pruning tables.
+#   The tables are built with numpy the first time they are needed and saved in TABLES_DIR (see tables.py)
+#
+
+
+# --- IMPORTS -------------------------------------------------------------------------------------------------
+from itertools import permutations, product
+from math import comb, factorial
+import os
+
+import numpy as np
+
+from cube import FACE_NORMALS, FACE_ORDER, MOVE_PERMUTATIONS, cube_geometry
+from tables import cached_table
+
+
+# --- CONSTANTS ------------------------------------------------------------------------------------------------
+TABLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "solver_tables")
+TABLES_VERSION = 1 # Increase when the way the tables are built changes, so saved tables get rebuilt
+DEFAULT_MAX_LENGTH = 24 # Longest solution accepted (in face turns, a half turn counts as one)
+
+FACES = ["U", "R", "F", "D", "L", "B"]
+OPPOSITE = [3, 4, 5, 0, 1, 2] # Index in FACES of the opposite face
+SOLVER_MOVES = [face + suffix for face in FACES for suffix in ["", "2", "'"]] # Move 3*face + (quarter, half, prime)
+PHASE2_MOVES = [SOLVER_MOVES.index(move) for move in ["U", "U2", "U'", "D", "D2", "D'", "R2", "L2", "F2", "B2"]]
+
+PHASE2_MAX_LENGTH = 12 # Longest phase 2 tried after each phase 1 solution
+
+N_SLICE = comb(12, 4) # Positions of the E-slice edges
+
+
+# --- CUBIES ---------------------------------------------------------------------------------------------------
+def cubie_positions():
+	# Square slots of every corner and edge position of the 3x3 geometry
+	# Corner slots start with the U/D square and go around the corner in the same direction for every corner,
+	# edge slots start with the U/D square (or the F/B square for E-slice edges)
+	# The 4 E-slice edges come last
+	geometry = cube_geometry(3)
+	normals = np.array([FACE_NORMALS[FACE_ORDER[face]] for face in geometry.square_faces])
+
+	cells = {}
+	for index, cell in enumerate(map(tuple, geometry.square_layers.tolist())):
+		cells.setdefault(cell, []).append(index)
+
+	corners, edges, slice_edges = [], [], []
+	for cell, slots in sorted(cells.items()):
+		if len(slots) == 3:
+			slots.sort(key=lambda slot: normals[slot][1] == 0)
+			if np.linalg.det(normals[slots]) < 0:
+				slots[1], slots[2] = slots[2], slots[1]
+			corners.append(slots)
+		elif len(slots) == 2:
+			slots.sort(key=lambda slot: (normals[slot][1] == 0, normals[slot][2] == 0))
+			(slice_edges if cell[1] == 1 else edges).append(slots)
+
+	return corners, edges + slice_edges
+
+
+CORNER_SLOTS, EDGE_SLOTS = cubie_positions()
+
+
+def slot_faces(state):
+	# Face letter of the color on every slot, found from the center colors
+	geometry = cube_geometry(3)
+	center_colors = {}
+	for face in range(6):
+		slots = np.nonzero(geometry.square_faces == face)[0]
+		center_colors[int(state[slots[4]])] = FACE_ORDER[face]
+	return [center_colors[color] for color in np.asarray(state).tolist()]
+
+
+def reference_face(faces):
+	# Face that decides an edge's orientation: its U/D face, or its F/B face for E-slice edges
+	for face in "UDFB":
+		if face in faces:
+			return face
+
+
+SOLVED_FACES = slot_faces(cube_geometry(3).solved)
+CORNER_IDS = {frozenset(SOLVED_FACES[slot] for slot in slots): index for index, slots in enumerate(CORNER_SLOTS)}
+EDGE_IDS = {frozenset(SOLVED_FACES[slot] for slot in slots): index for index, slots in enumerate(EDGE_SLOTS)}
+
+
+def cubies(state):
+	# Returns (corner permutation, corner orientations, edge permutation, edge orientations) of a cube state,
+	# each position holding the index of the cubie on it
+	faces = slot_faces(state)
+	cp, co, ep, eo = [], [], [], []
+
+	for slots in CORNER_SLOTS:
+		corner_faces = [faces[slot] for slot in slots]
+		cubie = CORNER_IDS.get(frozenset(corner_faces))
+		if cubie is None:
+			raise ValueError(f"No corner has the colors {corner_faces}")
+		cp.append(cubie)
+		co.append(next(index for index, face in enumerate(corner_faces) if face in "UD"))
+
+	for slots in EDGE_SLOTS:
+		edge_faces = [faces[slot] for slot in slots]
+		cubie = EDGE_IDS.get(frozenset(edge_faces))
+		if cubie is None:
+			raise ValueError(f"No edge has the colors {edge_faces}")
+		ep.append(cubie)
+		eo.append(0 if edge_faces[0] == reference_face(edge_faces) else 1)
+
+	if sorted(cp) != list(range(8)) or sorted(ep) != list(range(12)):
+		raise ValueError("Some cubies appear more than once")
+	if sum(co) % 3 or sum(eo) % 2 or permutation_parity(cp) != permutation_parity(ep):
+		raise ValueError("The cube can't be solved (a cubie is twisted, flipped or swapped)")
+
+	return cp, co, ep, eo
+
+
+def permutation_parity(permutation):
+	return sum(a > b for index, a in enumerate(permutation) for b in permutation[index+1:]) % 2
+
+
+def cubie_moves():
+	# (cp, co, ep, eo) of each of SOLVER_MOVES, taken from the quarter turns of cube.py:
+	# applying move m gives cp[i] = cp[m_cp[i]], co[i] = co[m_cp[i]] + m_co[i], and the same for edges
+	moves = []
+	for face in FACES:
+		quarter = cubies(cube_geometry(3).solved[MOVE_PERMUTATIONS[face]])
+		move = cubies(cube_geometry(3).solved)
+		for _ in range(3):
+			move = multiply(move, quarter)
+			moves.append(move)
+	return moves
+
+
+def multiply(cubie_cube, move):
+	cp, co, ep, eo = cubie_cube
+	m_cp, m_co, m_ep, m_eo = move
+	return (
+		[cp[i] for i in m_cp],
+		[(co[i] + twist) % 3 for i, twist in zip(m_cp, m_co)],
+		[ep[i] for i in m_ep],
+		[(eo[i] + flip) % 2 for i, flip in zip(m_ep, m_eo)],
+	)
+
+
+CUBIE_MOVES = cubie_moves()
+
+
+# --- COORDINATES ----------------------------------------------------------------------------------------------
+# Every function takes a 2D array with one cube per row and returns one coordinate per row
+
+def twist_coord(co):
+	return co[:, :7] @ 3**np.arange(6, -1, -1)
+
+
+def flip_coord(eo):
+	return eo[:, :11] @ 2**np.arange(10, -1, -1)
+
+
+def permutation_coord(permutation):
+	# Lehmer code, 0 for the identity
+	size = permutation.shape[1]
+	coord = np.zeros(len(permutation), dtype=np.int64)
+	for index in range(size - 1):
+		smaller = (permutation[:, index+1:] < permutation[:, index:index+1]).sum(axis=1)
+		coord += smaller * factorial(size - 1 - index)
+	return coord
+
+
+def slice_sorted_coord(ep):
+	# Which 4 positions hold the E-slice edges (0 when they are in the E slice), times 24, plus their order
+	in_slice = ep >= 8
+	coord = np.zeros(len(ep), dtype=np.int64)
+	found = np.zeros(len(ep), dtype=np.int64)
+	for position in range(11, -1, -1):
+		coord += np.where(in_slice[:, position], comb_table(11 - position, found + 1), 0)
+		found += in_slice[:, position]
+
+	order = ep[in_slice].reshape(len(ep), 4) - 8
+	return coord * 24 + permutation_coord(order)
+
+
+def comb_table(n, k):
+	return np.array([comb(n, int(value)) for value in range(13)])[k]
+
+
+def corners_coord(cp):
+	return permutation_coord(cp)
+
+
+def ud_edges_coord(ep):
+	return permutation_coord(ep[:, :8])
+
+
+# --- TABLES ---------------------------------------------------------------------------------------------------
+def representatives():
+	# One cubie cube per value of each coordinate, in coordinate order:
+	# (coordinate name, coordinate function, cubie part, array of representatives)
+	twists = np.array(list(product(range(3), repeat=7)))
+	twists = np.hstack((twists, (-twists.sum(axis=1) % 3)[:, None]))
+
+	flips = np.array(list(product(range(2), repeat=11)))
+	flips = np.hstack((flips, (flips.sum(axis=1) % 2)[:, None]))
+
+	slice_edges = []
+	for positions in permutations(range(12), 4):
+		ep = [None] * 12
+		for edge, position in enumerate(positions):
+			ep[position] = edge + 8
+		others = iter(range(8))
+		slice_edges.append([edge if edge is not None else next(others) for edge in ep])
+	slice_edges = np.array(slice_edges)
+
+	corner_permutations = np.array(list(permutations(range(8))))
+	ud_edges = np.hstack((corner_permutations, np.tile(np.arange(8, 12), (len(corner_permutations), 1))))
+
+	parts = [
+		("twist", twist_coord, 1, twists),
+		("flip", flip_coord, 3, flips),
+		("slice_sorted", slice_sorted_coord, 2, slice_edges),
+		("corners", corners_coord, 0, corner_permutations),
+		("ud_edges", ud_edges_coord, 2, ud_edges),
+	]
+
+	ordered = []
+	for name, coord_function, part, cubes in parts:
+		coords = coord_function(cubes)
+		assert (np.sort(coords) == np.arange(len(cubes))).all(), name
+		ordered.append((name, coord_function, part, cubes[np.argsort(coords)]))
+	return ordered
+
+
+def move_tables():
+	# (coordinate count, number of moves) table of the coordinate reached by every move from every coordinate
+	# ud_edges only has the phase 2 moves (PHASE2_MOVES order), as it is only defined in phase 2
+	tables = {}
+	for name, coord_function, part, cubes in representatives():
+		moves = [CUBIE_MOVES[move] for move in (PHASE2_MOVES if name == "ud_edges" else range(18))]
+		columns = []
+		for move in moves:
+			if part in (0, 2):
+				moved = cubes[:, move[part]]
+			else:
+				permutation, orientation = move[part-1], move[part]
+				moved = (cubes[:, permutation] + orientation) % (3 if part == 1 else 2)
+			columns.append(coord_function(moved))
+		tables[name] = np.stack(columns, axis=1).astype(np.int32)
+	return tables
+
+
+def pruning_table(move_a, move_b, size_b, moves, goal_b):
+	# Moves needed to reach (0, any of goal_b) from every (a, b) pair, by breadth-first search over the pairs
+	# move_a is indexed with the move, move_b with the move's position in moves
+	distance = np.full(len(move_a) * size_b, -1, dtype=np.int8)
+	frontier = np.asarray(goal_b, dtype=np.int64)
+	distance[frontier] = 0
+
+	depth = 0
+	while len(frontier):
+		a, b = np.divmod(frontier, size_b)
+		reached = (move_a[a][:, moves] * size_b + move_b[b]).ravel()
+		reached = np.unique(reached[distance[reached] < 0])
+		depth += 1
+		distance[reached] = depth
+		frontier = reached
+
+	return distance
+
+
+def build_tables():
+	tables = move_tables()
+
+	# Phase 1 pruning uses only the slice positions, not their order
+	slice_move = tables["slice_sorted"][::24] // 24
+	tables["twist_slice_prune"] = pruning_table(tables["twist"], slice_move, N_SLICE, list(range(18)), [0])
+	tables["flip_slice_prune"] = pruning_table(tables["flip"], slice_move, N_SLICE, list(range(18)), [0])
+
+	# Phase 2 slice coordinate is the order of the E-slice edges, always below 24
+	slice_order_move = tables["slice_sorted"][:24][:, PHASE2_MOVES]
+	tables["corners_slice_prune"] = pruning_table(tables["corners"], slice_order_move, 24, PHASE2_MOVES, [0])
+	tables["edges_slice_prune"] = pruning_table(tables["ud_edges"], slice_order_move, 24, list(range(10)), [0])
+
+	return tables
+
+
+TABLE_NAMES = [
+	"twist", "flip", "slice_sorted", "corners", "ud_edges",
+	"twist_slice_prune", "flip_slice_prune", "corners_slice_prune", "edges_slice_prune",
+]
+
+
+def table_path(name):
+	return os.path.join(TABLES_DIR, name + ".tbl")
+
+
+def load_tables(verify=True):
+	# Memory-mapped tables from TABLES_DIR, all tables are built at once (and the missing ones saved)
+	# if any is missing, damaged or out of date
+	built = {}
+
+	def build(name):
+		if not built:
+			built.update(build_tables())
+		return built[name]
+
+	return {name: cached_table(table_path(name), lambda: build(name), TABLES_VERSION, verify) for name in TABLE_NAMES}
+
+
+def next_moves(moves):
+	# (index in moves, move) of the moves allowed after a move on each face, the last entry is for the first move:
+	# never the same face twice, and opposite faces (which commute) only in one order
+	allowed = []
+	for last_face in list(range(6)) + [-1]:
+		allowed.append([
+			(index, move) for index, move in enumerate(moves)
+			if last_face < 0 or not (move // 3 == last_face or (move // 3 == OPPOSITE[last_face] and move // 3 > last_face))
+		])
+	return allowed
+
+
+PHASE1_NEXT_MOVES = next_moves(range(18))
+PHASE2_NEXT_MOVES = next_moves(PHASE2_MOVES)
+
+
+# --- SEARCH ---------------------------------------------------------------------------------------------------
+class Solver:
+	# Looks the tables up through flat memoryviews: one lookup at a time is much faster than with numpy,
+	# and memory-mapped tables are used in place without being copied
+
+	def __init__(self, tables=None):
+		tables = load_tables() if tables is None else tables
+		flat = {name: memoryview(np.ascontiguousarray(table).reshape(-1)) for name, table in tables.items()}
+
+		self.twist_move = flat["twist"]
+		self.flip_move = flat["flip"]
+		self.slice_move = flat["slice_sorted"]
+		self.corners_move = flat["corners"]
+		self.ud_edges_move = flat["ud_edges"]
+		self.twist_slice_prune = flat["twist_slice_prune"]
+		self.flip_slice_prune = flat["flip_slice_prune"]
+		self.corners_slice_prune = flat["corners_slice_prune"]
+		self.edges_slice_prune = flat["edges_slice_prune"]
+
+	def solve(self, state, max_length=DEFAULT_MAX_LENGTH):
+		# Returns a list of SOLVER_MOVES (U, U2, U', ...) that solves a 3x3 cube state,
+		# or None if there is no solution of at most max_length moves
+		cp, co, ep, eo = cubies(state)
+		twist = int(twist_coord(np.array([co]))[0])
+		flip = int(flip_coord(np.array([eo]))[0])
+		slice_sorted = int(slice_sorted_coord(np.array([ep]))[0])
+		corners = int(corners_coord(np.array([cp]))[0])
+
+		self.start_corners = corners
+		self.start_edges = ep
+		self.max_length = max_length
+		self.phase1_moves = []
+		self.phase2_moves = []
+
+		slice_index = slice_sorted // 24
+		estimate = max(self.twist_slice_prune[twist*N_SLICE + slice_index], self.flip_slice_prune[flip*N_SLICE + slice_index])
+		for depth in range(estimate, max_length + 1):
+			if self.phase1(twist, flip, slice_sorted, depth):
+				return [SOLVER_MOVES[move] for move in self.phase1_moves + self.phase2_moves]
+
+		return None
+
+	def phase1(self, twist, flip, slice_sorted, togo):
+		moves = self.phase1_moves
+		if togo == 0:
+			# A phase 2 move last means a shorter phase 1 solution was already tried
+			if moves and moves[-1] in PHASE2_MOVES:
+				return False
+			return self.start_phase2(slice_sorted)
+
+		twist_move, flip_move, slice_move = self.twist_move, self.flip_move, self.slice_move
+		twist_slice_prune, flip_slice_prune = self.twist_slice_prune, self.flip_slice_prune
+
+		for _, move in PHASE1_NEXT_MOVES[moves[-1] // 3 if moves else -1]:
+			new_slice = slice_move[slice_sorted*18 + move]
+			slice_index = new_slice // 24
+			new_twist = twist_move[twist*18 + move]
+			if twist_slice_prune[new_twist*N_SLICE + slice_index] >= togo:
+				continue
+			new_flip = flip_move[flip*18 + move]
+			if flip_slice_prune[new_flip*N_SLICE + slice_index] >= togo:
+				continue
+
+			moves.append(move)
+			if self.phase1(new_twist, new_flip, new_slice, togo-1):
+				return True
+			moves.pop()
+
+		return False
+
+	def start_phase2(self, slice_sorted):
+		corners = self.start_corners
+		for move in self.phase1_moves:
+			corners = self.corners_move[corners*18 + move]
+
+		# Phase 2 is kept short: a longer phase 1 with a short phase 2 is found much faster
+		max_depth = min(self.max_length - len(self.phase1_moves), PHASE2_MAX_LENGTH)
+		if self.corners_slice_prune[corners*24 + slice_sorted] > max_depth:
+			return False
+
+		ep = self.start_edges
+		for move in self.phase1_moves:
+			ep = [ep[index] for index in CUBIE_MOVES[move][2]]
+		ud_edges = int(ud_edges_coord(np.array([ep]))[0])
+
+		estimate = max(self.corners_slice_prune[corners*24 + slice_sorted],
+			self.edges_slice_prune[ud_edges*24 + slice_sorted])
+		for depth in range(estimate, max_depth + 1):
+			if self.phase2(corners, ud_edges, slice_sorted, depth):
+				return True
+		return False
+
+	def phase2(self, corners, ud_edges, slice_sorted, togo):
+		if togo == 0:
+			return True
+
+		moves = self.phase2_moves
+		previous = moves[-1] if moves else (self.phase1_moves[-1] if self.phase1_moves else None)
+
+		corners_move, ud_edges_move, slice_move = self.corners_move, self.ud_edges_move, self.slice_move
+		corners_slice_prune, edges_slice_prune = self.corners_slice_prune, self.edges_slice_prune
+
+		for index, move in PHASE2_NEXT_MOVES[previous // 3 if previous is not None else -1]:
+			new_slice = slice_move[slice_sorted*18 + move]
+			new_corners = corners_move[corners*18 + move]
+			if corners_slice_prune[new_corners*24 + new_slice] >= togo:
+				continue
+			new_edges = ud_edges_move[ud_edges*10 + index]
+			if edges_slice_prune[new_edges*24 + new_slice] >= togo:
+				continue
+
+			moves.append(move)
+			if self.phase2(new_corners, new_edges, new_slice, togo-1):
+				return True
+			moves.pop()
+
+		return False
+
+
+# --- FUNCTIONS -----------------------------------------------------------------------------------------------
+_solver = None
+
+def get_solver():
+	# Tables are only loaded (or built) the first time a cube is solved
+	global _solver
+	if _solver is None:
+		_solver = Solver()
+	return _solver
+
+
+def to_quarter_turns(moves):
+	# Writes half turns as two quarter turns, so the moves are all in cube.ALL_MOVES
+	quarter_turns = []
+	for move in moves:
+		quarter_turns += [move[0], move[0]] if move.endswith("2") else [move]
+	return quarter_turns
+
+
+def solve(state, max_length=DEFAULT_MAX_LENGTH):
+	# Solution for a 3x3 cube state as moves from cube.ALL_MOVES, None if none was found within max_length
+	moves = get_solver().solve(state, max_length)
+	return None if moves is None else to_quarter_turns(moves)
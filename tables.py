@@ -0,0 +1,106 @@
+#
+#    tables.py
+#
+#   Versioned on-disk format for large precomputed tables (such as the solver's move and pruning tables)
+#
+#   Each file is a HEADER_SIZE byte header followed by the raw array data, which is opened with np.memmap:
+#   loading is near-instant and processes using the same file share its pages instead of each holding a copy
+#
+#   The header holds MAGIC, FORMAT_VERSION, the caller's own table version, the dtype, the shape and a CRC32 of
+#   the data. Files that are missing, damaged, or written with another version are rebuilt by cached_table
+#
+
+
+# --- IMPORTS -------------------------------------------------------------------------------------------------
+import os
+import struct
+import tempfile
+import zlib
+
+import numpy as np
+
+
+# --- CONSTANTS ------------------------------------------------------------------------------------------------
+MAGIC = b"VCUBETBL"
+FORMAT_VERSION = 1 # Increase when the header layout changes
+HEADER_SIZE = 64 # Keeps the data aligned for every dtype
+MAX_DIMENSIONS = 4
+
+# magic, format version, table version, dtype, number of dimensions, shape, CRC32 of the data
+HEADER = struct.Struct(f"<8sHH8sB{MAX_DIMENSIONS}QI")
+
+
+# --- FUNCTIONS -----------------------------------------------------------------------------------------------
+def save_table(path, array, version=0):
+	# Writes the array to a temporary file next to path and renames it over path,
+	# so readers never see a half-written table
+	array = np.ascontiguousarray(array)
+	if array.ndim > MAX_DIMENSIONS:
+		raise ValueError(f"Tables can have at most {MAX_DIMENSIONS} dimensions, got {array.ndim}")
+
+	shape = list(array.shape) + [0] * (MAX_DIMENSIONS - array.ndim)
+	header = HEADER.pack(MAGIC, FORMAT_VERSION, version, array.dtype.str.encode(), array.ndim, *shape,
+		zlib.crc32(array))
+
+	directory = os.path.dirname(os.path.abspath(path))
+	os.makedirs(directory, exist_ok=True)
+
+	descriptor, temporary_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+	try:
+		with os.fdopen(descriptor, "wb") as file:
+			file.write(header.ljust(HEADER_SIZE, b"\0"))
+			file.write(array.tobytes())
+			file.flush()
+			os.fsync(file.fileno())
+
+		# mkstemp creates the file readable by its owner only, tables get the permissions of any new file
+		umask = os.umask(0)
+		os.umask(umask)
+		os.chmod(temporary_path, 0o644 & ~umask)
+
+		os.replace(temporary_path, path)
+	except BaseException:
+		os.remove(temporary_path)
+		raise
+
+
+def load_table(path, version=0, verify=True):
+	# Returns the table as a read-only np.memmap, or None if the file is missing, isn't a table,
+	# has another format or table version, or (with verify) its data doesn't match its CRC32
+	try:
+		with open(path, "rb") as file:
+			header = file.read(HEADER_SIZE)
+		size = os.path.getsize(path)
+	except OSError:
+		return None
+
+	if len(header) < HEADER.size:
+		return None
+
+	magic, format_version, table_version, dtype, ndim, *rest = HEADER.unpack_from(header)
+	shape, crc = tuple(rest[:ndim]), rest[-1]
+	if magic != MAGIC or format_version != FORMAT_VERSION or table_version != version:
+		return None
+
+	try:
+		dtype = np.dtype(dtype.rstrip(b"\0").decode())
+	except (TypeError, UnicodeDecodeError):
+		return None
+
+	if size != HEADER_SIZE + dtype.itemsize * int(np.prod(shape)):
+		return None
+
+	table = np.memmap(path, dtype=dtype, mode="r", offset=HEADER_SIZE, shape=shape)
+	if verify and zlib.crc32(table) != crc:
+		return None
+
+	return table
+
+
+def cached_table(path, build, version=0, verify=True):
+	# Loads the table at path, or builds it with build(), saves it and loads the saved copy
+	table = load_table(path, version, verify)
+	if table is None:
+		save_table(path, build(), version)
+		table = load_table(path, version, verify=False)
+	return table
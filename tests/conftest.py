@@ -0,0 +1,12 @@
+#
+#    tests/conftest.py
+#
+#   Makes the modules at the root of the repository importable from the tests, however pytest is started
+#
+
+
+# --- IMPORTS -------------------------------------------------------------------------------------------------
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,280 @@
+#
+#    tests/test_engine.py
+#
+#   Tests of the cube engine, the solver, the table files and session logs (no window is opened)
+#
+#   Usage: python -m pytest -q
+#
+
+
+# --- IMPORTS -------------------------------------------------------------------------------------------------
+import os
+import random
+import stat
+
+import numpy as np
+import pytest
+
+import cube
+import solver
+import tables
+from cube import FACE_ORDER, Cube, apply_moves, apply_moves_batch, compile_moves, cube_geometry
+from session import CHECKPOINT, MOVE, TIMER_START, TIMER_STOP, Replay, SessionLog, SessionRecorder, replay_headless
+
+
+# --- HELPERS --------------------------------------------------------------------------------------------------
+def face_colors(state, face, n=3):
+	# How many squares of each color (in FACE_ORDER) are on a face
+	index = FACE_ORDER.index(face)
+	return np.bincount(state[index*n*n:(index+1)*n*n], minlength=6).tolist()
+
+
+def turned(moves, n=3):
+	# State of a solved cube after the moves, applied one at a time
+	state = cube_geometry(n).solved
+	for move in moves:
+		state = state[cube_geometry(n).permutation(move)]
+	return state
+
+
+# --- PERMUTATIONS ---------------------------------------------------------------------------------------------
+@pytest.mark.parametrize("move, face, colors", [
+	("U", "F", {"F": 6, "R": 3}), # The front's top row comes from the right
+	("U", "L", {"L": 6, "F": 3}),
+	("R", "U", {"U": 6, "F": 3}), # The right layer carries the front up
+	("R", "B", {"B": 6, "U": 3}),
+	("F", "R", {"R": 6, "U": 3}),
+	("D", "F", {"F": 6, "L": 3}),
+	("L", "F", {"F": 6, "U": 3}),
+	("B", "U", {"U": 6, "R": 3}),
+	("M", "F", {"F": 6, "U": 3}), # Middle slice turns like L
+	("x", "U", {"F": 9}), # Whole cube turns like R
+])
+def test_quarter_turns_move_the_right_squares(move, face, colors):
+	expected = [colors.get(color_face, 0) for color_face in FACE_ORDER]
+	assert face_colors(turned([move]), face) == expected
+
+
+@pytest.mark.parametrize("moves, order", [
+	(["R"], 4),
+	(["R", "U", "R'", "U'"], 6),
+	(["R", "U"], 105),
+	(["R2", "U2"], 6),
+])
+def test_sequences_have_their_known_orders(moves, order):
+	solved = cube.SOLVED_CUBE
+	permutation = compile_moves(moves)[1]
+	state = solved
+	for repeat in range(1, order + 1):
+		state = state[permutation]
+		assert np.array_equal(state, solved) == (repeat == order)
+
+
+def test_inverse_and_wide_moves():
+	assert np.array_equal(turned(["R", "R'"]), cube.SOLVED_CUBE)
+	assert np.array_equal(turned(["Rw"]), turned(["R", "M'"]))
+	assert np.array_equal(turned(["R2"]), turned(["R", "R"]))
+
+
+# --- COMPILED AND BATCHED MOVES -------------------------------------------------------------------------------
+@pytest.mark.parametrize("n", [2, 3, 4, 5])
+def test_compile_moves_matches_moves_one_at_a_time(n):
+	rng = random.Random(n)
+	geometry = cube_geometry(n)
+	for _ in range(20):
+		moves = [rng.choice(geometry.moves) for _ in range(rng.randint(0, 40))]
+		start = turned(cube.generate_scramble(10, rng, n), n)
+
+		one_at_a_time = start
+		for move in moves:
+			one_at_a_time = one_at_a_time[geometry.permutation(move)]
+
+		assert np.array_equal(start[compile_moves(moves, n)[1]], one_at_a_time)
+
+
+@pytest.mark.parametrize("n", [2, 3, 4])
+def test_apply_moves_batch_matches_apply_moves(n):
+	geometry = cube_geometry(n)
+	count, length = 50, 23 # Not a multiple of the batch chunk, so the leftover moves are applied too
+	scrambles = cube.generate_scramble_batch(count, length, 7, n)
+	cubes = np.tile(geometry.solved, (count, 1))
+
+	batched = apply_moves_batch(cubes, scrambles, n)
+	for row, scramble in enumerate(scrambles):
+		assert np.array_equal(batched[row], apply_moves(geometry.solved, [geometry.moves[move] for move in scramble], n))
+
+	# The same list of moves for every cube
+	assert np.array_equal(apply_moves_batch(batched, ["R", "U'"], n), batched[:, compile_moves(["R", "U'"], n)[1]])
+
+
+def test_apply_moves_batch_without_moves():
+	cubes = np.tile(cube.SOLVED_CUBE, (3, 1))
+	assert np.array_equal(apply_moves_batch(cubes, []), cubes)
+	assert np.array_equal(apply_moves_batch(cubes, np.zeros((3, 0), dtype=int)), cubes)
+
+
+def test_cube_tracks_solved_and_version():
+	test_cube = Cube(4)
+	moves = test_cube.scramble(30, random.Random(1))
+	assert not test_cube.is_solved()
+	assert test_cube.version > 0
+
+	inverse = [move[:-1] if move.endswith("'") else move + "'" for move in reversed(moves)]
+	version = test_cube.version
+	for move in inverse:
+		test_cube.turn(move)
+	assert test_cube.is_solved()
+	assert test_cube.version == version + len(inverse)
+
+
+# --- SOLVER ---------------------------------------------------------------------------------------------------
+def test_solver_solves_scrambles():
+	rng = random.Random(5)
+	for _ in range(5):
+		test_cube = Cube(3)
+		test_cube.scramble(25, rng)
+
+		moves = solver.solve(test_cube.state)
+		assert moves is not None
+		assert all(move in cube.ALL_MOVES for move in moves)
+
+		test_cube.apply(moves)
+		assert test_cube.is_solved()
+
+
+def test_solver_leaves_solved_cube_alone():
+	assert solver.solve(cube.SOLVED_CUBE) == []
+
+
+# --- TABLE FILES ----------------------------------------------------------------------------------------------
+def test_table_round_trip(tmp_path):
+	path = tmp_path / "table.tbl"
+	array = np.arange(1000, dtype=np.uint16).reshape(10, 100)
+	tables.save_table(path, array, version=3)
+
+	loaded = tables.load_table(path, version=3)
+	assert loaded.dtype == array.dtype
+	assert np.array_equal(loaded, array)
+	assert not list(tmp_path.glob("*.tmp"))
+
+	umask = os.umask(0)
+	os.umask(umask)
+	assert stat.S_IMODE(os.stat(path).st_mode) == 0o644 & ~umask
+
+
+def test_load_table_rejects_damaged_files(tmp_path):
+	path = tmp_path / "table.tbl"
+	tables.save_table(path, np.arange(1000, dtype=np.uint16))
+
+	data = bytearray(path.read_bytes())
+	data[tables.HEADER_SIZE + 10] ^= 0xFF
+	path.write_bytes(data)
+	assert tables.load_table(path) is None
+	assert tables.load_table(path, verify=False) is not None # Only the CRC32 catches it
+
+	path.write_bytes(data[:-1]) # Cut short
+	assert tables.load_table(path, verify=False) is None
+
+	path.write_bytes(b"not a table")
+	assert tables.load_table(path) is None
+	assert tables.load_table(tmp_path / "missing.tbl") is None
+
+
+def test_load_table_rejects_other_versions(tmp_path):
+	path = tmp_path / "table.tbl"
+	tables.save_table(path, np.arange(10, dtype=np.int32), version=1)
+	assert tables.load_table(path, version=2) is None
+
+	data = bytearray(path.read_bytes())
+	data[8:10] = (tables.FORMAT_VERSION + 1).to_bytes(2, "little") # Format version, after MAGIC
+	path.write_bytes(data)
+	assert tables.load_table(path, version=1) is None
+
+
+def test_cached_table_rebuilds_stale_files(tmp_path):
+	path = tmp_path / "table.tbl"
+	tables.save_table(path, np.zeros(4, dtype=np.int8), version=1)
+
+	builds = []
+	table = tables.cached_table(path, lambda: builds.append(1) or np.ones(4, dtype=np.int8), version=2)
+	assert builds == [1]
+	assert table.tolist() == [1, 1, 1, 1]
+	assert tables.load_table(path, version=2) is not None
+
+
+# --- SESSION LOGS ---------------------------------------------------------------------------------------------
+def record_session(path, moves_per_second, checkpoint_secs=1):
+	# Records moves_per_second[i] random moves in second i of a session (with clock times set by the test),
+	# a checkpoint every checkpoint_secs, and returns the state after every second
+	recorder = SessionRecorder(path, 3, checkpoint_secs)
+	clock = {"ms": 0}
+	recorder.now = lambda: clock["ms"]
+	recorder.checkpoint_due = lambda: clock["ms"] >= recorder.next_checkpoint * 1000
+
+	rng = random.Random(2)
+	live = Cube(3)
+	states = []
+	recorder.timer(TIMER_START)
+	for second, count in enumerate(moves_per_second):
+		for index in range(count):
+			clock["ms"] = second * 1000 + index * 1000 // count
+			if recorder.checkpoint_due():
+				recorder.checkpoint(live.state, (20, 325, 0))
+			move = rng.choice(cube.ALL_MOVES)
+			live.turn(move)
+			recorder.move(move)
+			recorder.view((20, (325 + clock["ms"] / 10) % 360, 0))
+		states.append(live.state.copy())
+
+	clock["ms"] = len(moves_per_second) * 1000
+	recorder.timer(TIMER_STOP, 12.5)
+	recorder.close()
+	return states
+
+
+def test_session_replays_to_the_live_state(tmp_path):
+	path = tmp_path / "session.vcl"
+	states = record_session(path, [10] * 6)
+	log = SessionLog(path)
+
+	assert log.n == 3
+	assert log.kinds.count(MOVE) == 60
+	assert log.kinds.count(CHECKPOINT) == 6
+
+	summary = replay_headless(log)
+	assert summary["moves"] == 60
+	assert summary["solve_times"] == [12.5]
+
+	replay = Replay(log)
+	replay.seek(log.duration)
+	assert np.array_equal(replay.cube.state, states[-1])
+	assert replay.timer_seconds() == 12.5
+
+
+def test_session_seeks_match_a_fresh_replay(tmp_path):
+	path = tmp_path / "session.vcl"
+	states = record_session(path, [7] * 8, checkpoint_secs=2)
+	log = SessionLog(path)
+
+	replay = Replay(log)
+	for seconds in [3.999, 7.5, 0.5, 5.999, 1.999, 7.999]: # Forwards, backwards and across checkpoints
+		replay.seek(seconds)
+		fresh = Replay(log)
+		fresh.seek(seconds)
+		assert np.array_equal(replay.cube.state, fresh.cube.state)
+		assert replay.view == fresh.view
+
+		if seconds % 1 > 0.99: # The last move of a second has been made
+			assert np.array_equal(replay.cube.state, states[int(seconds)])
+
+
+def test_session_log_cut_short_is_read_up_to_its_last_record(tmp_path):
+	path = tmp_path / "session.vcl"
+	record_session(path, [5, 5])
+	records = len(SessionLog(path).kinds)
+	path.write_bytes(path.read_bytes()[:-3]) # Into the payload of the last record (the timer stopping)
+
+	log = SessionLog(path)
+	assert len(log.kinds) == records - 1
+	assert log.kinds.count(MOVE) == 10
+	assert replay_headless(log)["solve_times"] == []
@@ -0,0 +1,58 @@
+#
+#    tweens.py
+#
+#   Tweens: values changed a little every step of the main loop over a set time, any number at once
+#
+#   Every tween has a name. Starting a tween replaces the running one with the same name, and cancel(name) stops
+#   it where it is (without calling its on_done), so transitions never hold up the main loop and can be interrupted
+#   A tween without an update function is just a delay before its on_done
+#
+
+
+# --- EASINGS -------------------------------------------------------------------------------------------------
+def linear(progress):
+	return progress
+
+
+# --- TWEENS --------------------------------------------------------------------------------------------------
+class Tween:
+	def __init__(self, duration, update, on_done, ease):
+		self.duration = duration # Seconds
+		self.update = update # Called with the eased progress (0 to 1) every step
+		self.on_done = on_done # Called after the last update
+		self.ease = ease
+		self.elapsed = 0
+
+
+class Tweens:
+	# The running tweens, by name
+
+	def __init__(self):
+		self.running = {}
+
+	def start(self, name, duration, update=None, on_done=None, ease=linear):
+		self.running[name] = Tween(duration, update, on_done, ease)
+
+	def cancel(self, name):
+		# Returns whether the tween was running
+		return self.running.pop(name, None) is not None
+
+	def active(self, name=None):
+		# Whether the tween (or any tween) is running
+		return name in self.running if name else bool(self.running)
+
+	def step(self, seconds):
+		# Advances every tween by seconds, tweens started by an on_done first step on the next call
+		for name, tween in list(self.running.items()):
+			if self.running.get(name) is not tween: # Replaced or cancelled by another tween this step
+				continue
+
+			tween.elapsed += seconds
+			progress = min(tween.elapsed / tween.duration, 1) if tween.duration > 0 else 1
+			if tween.update:
+				tween.update(tween.ease(progress))
+
+			if progress == 1 and self.running.get(name) is tween:
+				del self.running[name]
+				if tween.on_done:
+					tween.on_done()